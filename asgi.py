@@ -0,0 +1,29 @@
+"""
+ASGI config for strength project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with any ASGI server, e.g. ``uvicorn asgi:application``.
+
+Under ASGI the coach and trainer SSE endpoints are async views (see
+asgi_urls.py), so an open stream costs a coroutine rather than a thread.
+Concurrency ceiling per process:
+
+* COACH_MAX_CONCURRENT_STREAMS upstream LLM streams run at once (default:
+  ANTHROPIC_MAX_CONNECTIONS, 20). Further SSE clients stay connected and
+  wait for a slot; response cache hits never take one.
+* ORM work runs through sync_to_async on Django's single thread-sensitive
+  executor, so database access is serialized per process. The SSE views
+  only touch the database briefly before and after streaming.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+os.environ.setdefault("DJANGO_ROOT_URLCONF", "asgi_urls")
+
+application = get_asgi_application()
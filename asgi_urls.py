@@ -0,0 +1,23 @@
+"""
+URL configuration used by asgi.py.
+
+Serves the SSE endpoints and the history export with async views so open
+streams share the event loop instead of each holding a worker thread; every
+other route is the same as in urls.py.
+"""
+
+from django.urls import path
+
+from exercise.views import coach_stream_async, export_history_async, trainer_summary_stream_async
+from urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path("strength/coach-stream/<int:exercise>/", coach_stream_async, name="coach_stream"),
+    path("strength/trainer-summary/<str:category>/", trainer_summary_stream_async, name="trainer_summary_stream"),
+    path(
+        "strength/trainer-summary/<str:category>/<int:workout_id>/",
+        trainer_summary_stream_async,
+        name="trainer_summary_stream_past",
+    ),
+    path("strength/export/history.<str:fmt>", export_history_async, name="export_history"),
+] + sync_urlpatterns
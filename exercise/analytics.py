@@ -0,0 +1,220 @@
+from dataclasses import dataclass
+from datetime import date
+
+import numpy as np
+from django.core.cache import cache
+from numpy.lib.stride_tricks import sliding_window_view
+
+from exercise.models import Exercise, Set
+
+E1RM_MAX_REPS = 12  # Epley's estimate is unreliable for sets longer than this
+TREND_WINDOW = 8  # Sessions each trend slope is fitted over
+DIGEST_REP_PRS = 3  # Weights whose rep PRs the digest lists
+DIGEST_TIMEOUT = 60 * 60 * 12  # Seconds
+
+
+@dataclass
+class SetHistory:
+    """An exercise's completed sets as parallel arrays, oldest first"""
+
+    days: np.ndarray  # Workout dates as proleptic ordinals
+    reps: np.ndarray  # Reps or seconds; 0 where not recorded
+    pounds: np.ndarray  # 0 for bodyweight sets
+
+
+def load_histories(exercise_ids) -> dict[int, SetHistory]:
+    """Map exercise pk to its SetHistory, in one query; exercises without completed sets are left out"""
+    rows = list(
+        Set.objects.filter(exercise__exercise__in=exercise_ids, exercise__workout__completed=True)
+        .order_by()
+        .values_list("exercise__exercise_id", "exercise__workout__date", "reps_or_secs", "pounds")
+    )
+    if not rows:
+        return {}
+    exercises, days, reps, pounds = zip(*rows)
+    exercises = np.array(exercises)
+    days = np.fromiter((day.toordinal() for day in days), dtype=np.int64, count=len(rows))
+    # None becomes NaN in a float array, and then 0
+    reps = np.nan_to_num(np.array(reps, dtype=float))
+    pounds = np.nan_to_num(np.array(pounds, dtype=float))
+
+    # Sorting here is cheaper than in the database; the order of sets within a day doesn't matter
+    order = np.lexsort((days, exercises))
+    exercises, days, reps, pounds = exercises[order], days[order], reps[order], pounds[order]
+
+    starts = np.flatnonzero(np.r_[True, exercises[1:] != exercises[:-1]])
+    return {
+        int(exercises[start]): SetHistory(*columns)
+        for start, *columns in zip(starts, *(np.split(a, starts[1:]) for a in (days, reps, pounds)))
+    }
+
+
+def estimated_1rm(reps, pounds):
+    """Epley estimate of each set's one-rep max; NaN for sets it doesn't apply to"""
+    applies = (reps >= 1) & (reps <= E1RM_MAX_REPS) & (pounds > 0)
+    return np.where(applies, pounds * (1 + reps / 30), np.nan)
+
+
+def rolling_slopes(x, y, window):
+    """Least-squares slope of y against x over each run of `window` points, NaN before the first full run"""
+    slopes = np.full(len(y), np.nan)
+    if window >= 2 and len(y) >= window:
+        xs = sliding_window_view(x.astype(float), window)
+        ys = sliding_window_view(y, window)
+        xs = xs - xs.mean(axis=1, keepdims=True)
+        ys = ys - ys.mean(axis=1, keepdims=True)
+        slopes[window - 1 :] = (xs * ys).sum(axis=1) / (xs * xs).sum(axis=1)
+    return slopes
+
+
+@dataclass
+class Progress:
+    """Long-term progress of one exercise, with one entry per session (workout date) in the arrays"""
+
+    exercise: Exercise
+    sessions: np.ndarray  # Session dates as proleptic ordinals, oldest first
+    tonnage: np.ndarray  # Sum of pounds x reps
+    best_e1rm: np.ndarray  # NaN where no set has an estimate
+    best_reps: np.ndarray
+    trend: np.ndarray  # Change in the trend metric per week, over the window ending at each session
+    trend_metric: str  # "e1rm", or "reps_or_secs" for exercises without estimates
+    trend_window: int
+    rep_prs: np.ndarray  # (pounds, reps, date) rows: the most reps at each weight, first reached on date
+    last_weights: np.ndarray  # Distinct weights used in the latest session
+
+    @property
+    def unit(self):
+        return "secs" if self.exercise.is_seconds else "reps"
+
+    def as_dict(self):
+        """JSON-ready progress, with the per-session values as parallel lists"""
+
+        def numbers(values):
+            return [None if value != value else value for value in np.round(values, 1).tolist()]
+
+        return {
+            "exercise": self.exercise.pk,
+            "name": self.exercise.name,
+            "trend_metric": self.trend_metric,
+            "trend_window": self.trend_window,
+            "sessions": {
+                "date": [date.fromordinal(day).isoformat() for day in self.sessions.tolist()],
+                "tonnage": numbers(self.tonnage),
+                "best_e1rm": numbers(self.best_e1rm),
+                "best_reps_or_secs": numbers(self.best_reps),
+                "trend_per_week": numbers(self.trend),
+            },
+            "rep_prs": [
+                {"pounds": pounds, "reps_or_secs": reps, "date": date.fromordinal(day).isoformat()}
+                for pounds, reps, day in self.rep_prs.astype(int).tolist()
+            ],
+        }
+
+    def digest(self) -> list[str]:
+        """A couple of lines on long-term progress for the coach summary"""
+        if not len(self.sessions):
+            return []
+        parts = [f"{len(self.sessions)} sessions since {date.fromordinal(int(self.sessions[0]))}"]
+        if self.trend_metric == "e1rm":
+            best = np.nanargmax(self.best_e1rm)
+            latest = self.best_e1rm[~np.isnan(self.best_e1rm)][-1]
+            parts.append(
+                f"best e1RM {self.best_e1rm[best]:.0f} lbs on {date.fromordinal(int(self.sessions[best]))}, "
+                f"latest {latest:.0f} lbs"
+            )
+            unit = "lbs"
+        else:
+            parts.append(f"most {self.unit} {self.best_reps.max():.0f}, latest {self.best_reps[-1]:.0f}")
+            unit = self.unit
+        if not np.isnan(self.trend[-1]):
+            parts.append(f"trend {self.trend[-1]:+.1f} {unit}/week over the last {self.trend_window} sessions")
+        if self.tonnage[-1] > 0:
+            earlier = self.tonnage[-self.trend_window - 1 : -1]
+            tonnage = f"last tonnage {self.tonnage[-1]:.0f} lbs"
+            if len(earlier):
+                tonnage += f" ({len(earlier)}-session avg {earlier.mean():.0f})"
+            parts.append(tonnage)
+        lines = ["Long-term: " + "; ".join(parts)]
+
+        prs = self.rep_prs[np.isin(self.rep_prs[:, 0], self.last_weights) & (self.rep_prs[:, 0] > 0)]
+        if len(prs):
+            lines.append(
+                "Rep PRs at last weights: "
+                + "; ".join(
+                    f"{pounds:.0f} lbs x {reps:.0f} ({date.fromordinal(int(day))})"
+                    for pounds, reps, day in prs[-DIGEST_REP_PRS:]
+                )
+            )
+        return lines
+
+
+def compute(exercise, history: SetHistory, trend_window=TREND_WINDOW) -> Progress:
+    """Progress from an exercise's history, with every step vectorized over its sets or sessions"""
+    days, reps, pounds = history.days, history.reps, history.pounds
+    sessions, starts = np.unique(days, return_index=True)
+
+    e1rm = estimated_1rm(reps, pounds) if not exercise.is_seconds else np.full(len(reps), np.nan)
+    best_e1rm = np.fmax.reduceat(e1rm, starts)
+    best_reps = np.maximum.reduceat(reps, starts)
+    tonnage = np.add.reduceat(reps * pounds if not exercise.is_seconds else np.zeros(len(reps)), starts)
+
+    # Trend over the sessions that have the metric, spread back over every session
+    has_e1rm = ~np.isnan(best_e1rm)
+    trend_metric = "e1rm" if has_e1rm.any() else "reps_or_secs"
+    measured = has_e1rm if trend_metric == "e1rm" else np.ones(len(sessions), dtype=bool)
+    metric = best_e1rm if trend_metric == "e1rm" else best_reps
+    trend = np.full(len(sessions), np.nan)
+    trend[measured] = rolling_slopes(sessions[measured], metric[measured], trend_window) * 7
+
+    # Sorted by weight, then reps, then latest date first, the last set at each weight is its rep PR
+    done = reps > 0
+    order = np.lexsort((-days[done], reps[done], pounds[done]))
+    by_weight = np.column_stack([pounds[done], reps[done], days[done]])[order]
+    rep_prs = by_weight[np.r_[by_weight[1:, 0] != by_weight[:-1, 0], True]] if len(by_weight) else by_weight
+
+    return Progress(
+        exercise=exercise,
+        sessions=sessions,
+        tonnage=tonnage,
+        best_e1rm=best_e1rm,
+        best_reps=best_reps,
+        trend=trend,
+        trend_metric=trend_metric,
+        trend_window=trend_window,
+        rep_prs=rep_prs.reshape(-1, 3),
+        last_weights=np.unique(pounds[starts[-1] :]),
+    )
+
+
+def load_progress(exercises, trend_window=TREND_WINDOW) -> dict[int, Progress]:
+    """Map exercise pk to its Progress for those of `exercises` with completed sets"""
+    histories = load_histories([exercise.pk for exercise in exercises])
+    return {
+        exercise.pk: compute(exercise, histories[exercise.pk], trend_window)
+        for exercise in exercises
+        if exercise.pk in histories
+    }
+
+
+def digest_key(stats):
+    """Cache key for the digest of the history an ExerciseStats row was last refreshed from
+
+    Each process has its own cache, so the key changes whenever stats.refresh
+    recomputes the row rather than relying on the cached digest being dropped.
+    """
+    return f"progress_digest:{stats.exercise_id}:{stats.refreshed.timestamp()}"
+
+
+def get_digests(exercises, stats) -> dict[int, list[str]]:
+    """Map exercise pk to its Progress.digest() lines, computing only those not cached
+
+    stats maps each exercise's pk to its ExerciseStats row.
+    """
+    keys = {digest_key(stats[exercise.pk]): exercise for exercise in exercises}
+    digests = {keys[key].pk: lines for key, lines in cache.get_many(keys).items()}
+    if missing := [exercise for exercise in exercises if exercise.pk not in digests]:
+        fresh = {exercise.pk: [] for exercise in missing}
+        fresh.update((pk, progress.digest()) for pk, progress in load_progress(missing).items())
+        cache.set_many({digest_key(stats[pk]): lines for pk, lines in fresh.items()}, DIGEST_TIMEOUT)
+        digests.update(fresh)
+    return digests
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ExerciseConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "exercise"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from exercise.timing import install_query_timer
+
+        connection_created.connect(install_query_timer)
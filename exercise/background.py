@@ -0,0 +1,32 @@
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+_lock = threading.Lock()
+_executors: dict[str, ThreadPoolExecutor] = {}
+
+
+def get_executor(name: str, max_workers: int) -> ThreadPoolExecutor:
+    """Return the process-wide thread pool called `name`, starting it on first use"""
+    with _lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        return _executors[name]
+
+
+def closes_connections(fn):
+    """Wrap a function run on a worker thread to close that thread's database connections when it returns
+
+    Each thread gets its own connections, and nothing else closes a pool thread's.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            connections.close_all()
+
+    return wrapper
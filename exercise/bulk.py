@@ -0,0 +1,39 @@
+from django.db import connection
+
+from exercise.models import Set
+
+# Flat training history, one row per set: what export_history writes and import_history reads
+HISTORY_COLUMNS = [
+    "date",
+    "workout",  # Only tells apart workouts on the same date
+    "order",
+    "exercise",
+    "category",
+    "set_num",
+    "reps_or_secs",
+    "pounds",
+    "duration_secs",
+    "note",
+]
+
+SET_COLUMNS = ["exercise", "set_num", "reps_or_secs", "pounds", "note", "duration_secs"]
+
+
+def insert_sets(rows):
+    """Insert set rows, tuples in SET_COLUMNS order, with multi-row INSERTs
+
+    Building a Set instance per row costs far more than the database does
+    here, so rows go in as plain tuples.
+    """
+    fields = [Set._meta.get_field(name) for name in SET_COLUMNS]
+    table = connection.ops.quote_name(Set._meta.db_table)
+    columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+    row_sql = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    batch_size = min(connection.ops.bulk_batch_size(fields, rows), 5000)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start : start + batch_size]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {', '.join([row_sql] * len(batch))}",
+                [value for row in batch for value in row],
+            )
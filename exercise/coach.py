@@ -1,12 +1,25 @@
-import anthropic
-from typing import Iterable
+import asyncio
+import weakref
+from typing import AsyncIterator, Iterable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from exercise import response_cache, singleflight, telemetry
+from exercise.llm import CompletionRequest, get_backend
+
+MODEL = "claude-3-sonnet-20240229"
+COACH_MAX_TOKENS = 150
+TRAINER_SUMMARY_MAX_TOKENS = 400
 
 SYSTEM_PROMPT = """You are a knowledgeable and encouraging strength training coach providing real-
 time feedback during workouts.
 
 The summary shows:
 1. Previous attempts at all exercises in the current category
-2. Today's progress on all exercises in the category
+2. Long-term progress for exercises with history: estimated one-rep max (e1RM), its trend,
+   tonnage (pounds x reps) and rep PRs at the weights last used
+3. Today's progress on all exercises in the category
 
 IMPORTANT RULES:
 - For the current exercise (the one marked as "Currently on:"), give preparation advice 
@@ -43,39 +56,152 @@ Be concise, encouraging, data-driven, and provide specific observations when pos
 Limit your response to 3-4 short paragraphs maximum."""
 
 
-def get_coach_response(summary_lines: list[str]) -> Iterable[str]:
-    """Get streaming response from Claude based on workout summary"""
+def stream_completion(system: str, prompt: str, max_tokens: int, endpoint: str) -> Iterable[str]:
+    """Stream Claude's reply, replaying it from the response cache when the same request was seen before
+
+    Identical requests made while a reply is still streaming share that one
+    upstream stream instead of starting their own. Each call is recorded in
+    LLMCall under `endpoint`.
+    """
+    call = telemetry.Call(endpoint, MODEL, prompt)
+    yield from call.track(_stream_completion(system, prompt, max_tokens, call))
+
+
+def _stream_completion(system: str, prompt: str, max_tokens: int, call: telemetry.Call) -> Iterable[str]:
+    key = response_cache.cache_key(MODEL, system, prompt)
+    if (cached := response_cache.get(key)) is not None:
+        call.cache = "hit"
+        yield cached
+        return
+
+    flight, leader = singleflight.join(key)
+    if not leader:
+        call.cache, call.flight = "shared", flight
+        yield from flight.follow()
+        return
+
+    call.request = CompletionRequest(MODEL, system, prompt, max_tokens)
+    upstream = get_backend().stream(call.request)
+    try:
+        try:
+            for text in upstream:
+                flight.publish(text)
+                yield text
+        except GeneratorExit:
+            # This client went away; keep the stream going only while other requests follow along
+            flight.leave()
+            if singleflight.abandon(key, flight):
+                raise
+            for text in upstream:
+                if singleflight.abandon(key, flight):
+                    raise
+                flight.publish(text)
+
+        # Only complete responses are cached
+        if flight.chunks:
+            response_cache.store(key, MODEL, "".join(flight.chunks))
+    except Exception:
+        flight.failed = True
+        raise
+    finally:
+        singleflight.land(key, flight)
+
+
+_stream_slots = weakref.WeakKeyDictionary()
+
+
+def get_stream_slots() -> asyncio.Semaphore:
+    """Bound concurrent upstream streams on the running event loop to COACH_MAX_CONCURRENT_STREAMS"""
+    loop = asyncio.get_running_loop()
+    if loop not in _stream_slots:
+        _stream_slots[loop] = asyncio.Semaphore(settings.COACH_MAX_CONCURRENT_STREAMS)
+    return _stream_slots[loop]
+
+
+async def drive_flight(key: str, flight: singleflight.Flight, request: CompletionRequest):
+    try:
+        async with get_stream_slots():
+            async for text in get_backend().astream(request):
+                flight.publish(text)
+        if flight.chunks:
+            await sync_to_async(response_cache.store)(key, request.model, "".join(flight.chunks))
+    except Exception:
+        flight.failed = True
+        raise
+    finally:
+        singleflight.land(key, flight)
+
+
+async def astream_completion(system: str, prompt: str, max_tokens: int, endpoint: str) -> AsyncIterator[str]:
+    """Async counterpart of stream_completion for the ASGI views
+
+    The upstream stream runs in its own task, so it completes (and is cached)
+    even if the request that started it disconnects.
+    """
+    call = telemetry.Call(endpoint, MODEL, prompt)
+    async for text in call.atrack(_astream_completion(system, prompt, max_tokens, call)):
+        yield text
+
+
+async def _astream_completion(system: str, prompt: str, max_tokens: int, call: telemetry.Call) -> AsyncIterator[str]:
+    key = response_cache.cache_key(MODEL, system, prompt)
+    if (cached := await sync_to_async(response_cache.get)(key)) is not None:
+        call.cache = "hit"
+        yield cached
+        return
+
+    flight, leader = singleflight.join(key)
+    call.flight = flight
+    if leader:
+        call.request = CompletionRequest(MODEL, system, prompt, max_tokens)
+        flight.task = asyncio.create_task(drive_flight(key, flight, call.request))
+    else:
+        call.cache = "shared"
+    async for text in flight.afollow():
+        yield text
+
+
+def build_coach_prompt(summary_lines: list[str]) -> str:
     # Combine the lines into a clean format for Claude
     summary = "\n".join(summary_lines)
-    prompt = f"""Based on this workout information:
+    return f"""Based on this workout information:
 
 {summary}
 
 Provide encouraging, relevant coaching feedback."""
 
-    client = anthropic.Client()
-    with client.messages.stream(
-        model="claude-3-sonnet-20240229",
-        max_tokens=150,
-        temperature=0.7,
-        system=SYSTEM_PROMPT,
-        messages=[{"role": "user", "content": prompt}],
-    ) as stream:
-        for message in stream:
-            if hasattr(message, "text"):
-                # Just yield the text directly without buffering or chunking
-                yield message.text
 
+def get_coach_response(summary_lines: list[str], endpoint: str = "coach") -> Iterable[str]:
+    """Get streaming response from Claude based on workout summary"""
+    yield from stream_completion(
+        SYSTEM_PROMPT, build_coach_prompt(summary_lines), max_tokens=COACH_MAX_TOKENS, endpoint=endpoint
+    )
+
+
+async def aget_coach_response(summary_lines: list[str]) -> AsyncIterator[str]:
+    async for text in astream_completion(
+        SYSTEM_PROMPT, build_coach_prompt(summary_lines), max_tokens=COACH_MAX_TOKENS, endpoint="coach"
+    ):
+        yield text
+
+
+def format_duration(set_obj) -> str:
+    if not set_obj.duration_secs:
+        return ""
+    mins = set_obj.duration_secs // 60
+    secs = set_obj.duration_secs % 60
+    return f" (completed in {mins:02d}:{secs:02d})"
 
-def get_trainer_summary(category_data: list[dict]) -> Iterable[str]:
-    """Get streaming category analysis from Claude based on workout data
+
+def build_trainer_summary_prompt(category_data: list[dict]) -> str:
+    """Format category data as the trainer prompt, using only the preloaded sets
 
     Args:
         category_data: List of dictionaries containing exercise data with structure:
             {
-                "exercise": WorkoutExercise instance,
-                "current_sets": List of rendered set strings for current workout,
-                "last_sets": List of rendered set strings from previous workout,
+                "exercise": WorkoutExercise instance (with exercise loaded),
+                "current_sets": List of Set instances for the current workout, in order,
+                "last_sets": List of Set instances from the previous workout, in order,
                 "last_workout": Previous Workout instance or None
             }
     """
@@ -94,15 +220,8 @@ def get_trainer_summary(category_data: list[dict]) -> Iterable[str]:
         # Current workout
         summary_lines.append("Current workout:")
         if current_sets:
-            for i, set_str in enumerate(current_sets, 1):
-                # Get the set object to check for duration_secs
-                set_obj = exercise.sets.filter(set_num=i).first()
-                time_info = ""
-                if set_obj and set_obj.duration_secs:
-                    mins = set_obj.duration_secs // 60
-                    secs = set_obj.duration_secs % 60
-                    time_info = f" (completed in {mins:02d}:{secs:02d})"
-                summary_lines.append(f"  Set {i}: {set_str}{time_info}")
+            for i, set_obj in enumerate(current_sets, 1):
+                summary_lines.append(f"  Set {i}: {set_obj.render()}{format_duration(set_obj)}")
         else:
             summary_lines.append("  No sets completed")
 
@@ -111,40 +230,42 @@ def get_trainer_summary(category_data: list[dict]) -> Iterable[str]:
         if last_workout:
             summary_lines.append(f"  Date: {last_workout.date}")
             if last_sets:
-                for i, set_str in enumerate(last_sets, 1):
-                    # Try to get the set object to check for duration
-                    if last_workout and exercise_info.get("last_exercise"):
-                        last_exercise = exercise_info["last_exercise"]
-                        set_obj = last_exercise.sets.filter(set_num=i).first()
-                        time_info = ""
-                        if set_obj and set_obj.duration_secs:
-                            mins = set_obj.duration_secs // 60
-                            secs = set_obj.duration_secs % 60
-                            time_info = f" (completed in {mins:02d}:{secs:02d})"
-                        summary_lines.append(f"  Set {i}: {set_str}{time_info}")
-                    else:
-                        summary_lines.append(f"  Set {i}: {set_str}")
+                for i, set_obj in enumerate(last_sets, 1):
+                    summary_lines.append(f"  Set {i}: {set_obj.render()}{format_duration(set_obj)}")
             else:
                 summary_lines.append("  No sets completed")
         else:
             summary_lines.append("  No previous data")
 
     summary = "\n".join(summary_lines)
-    prompt = f"""Here's a summary of the recently completed category:
+    return f"""Here's a summary of the recently completed category:
 
 {summary}
 
 Provide encouraging, relevant coaching feedback."""
 
-    client = anthropic.Client()
-    with client.messages.stream(
-        model="claude-3-sonnet-20240229",
-        max_tokens=400,
-        temperature=0.7,
-        system=TRAINER_SUMMARY_PROMPT,
-        messages=[{"role": "user", "content": prompt}],
-    ) as stream:
-        for message in stream:
-            if hasattr(message, "text"):
-                # Just yield the text directly without buffering or chunking
-                yield message.text
+
+def trainer_summary_hash(category_data: list[dict]) -> str:
+    """Identify the exact trainer request this data produces, so stored replies can be checked for staleness"""
+    return response_cache.cache_key(MODEL, TRAINER_SUMMARY_PROMPT, build_trainer_summary_prompt(category_data))
+
+
+def get_trainer_summary(category_data: list[dict]) -> Iterable[str]:
+    """Get streaming category analysis from Claude based on workout data
+
+    See build_trainer_summary_prompt for the shape of category_data.
+    """
+    prompt = build_trainer_summary_prompt(category_data)
+
+    yield from stream_completion(
+        TRAINER_SUMMARY_PROMPT, prompt, max_tokens=TRAINER_SUMMARY_MAX_TOKENS, endpoint="trainer_summary"
+    )
+
+
+async def aget_trainer_summary(category_data: list[dict]) -> AsyncIterator[str]:
+    """Async counterpart of get_trainer_summary; category_data must already be loaded"""
+    prompt = build_trainer_summary_prompt(category_data)
+    async for text in astream_completion(
+        TRAINER_SUMMARY_PROMPT, prompt, max_tokens=TRAINER_SUMMARY_MAX_TOKENS, endpoint="trainer_summary"
+    ):
+        yield text
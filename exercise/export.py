@@ -0,0 +1,81 @@
+import csv
+import json
+from itertools import islice
+from typing import AsyncIterator, Iterable
+
+from exercise.bulk import HISTORY_COLUMNS
+from exercise.models import Set
+
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+EXPORT_CHUNK_SIZE = 2000  # Rows fetched from the cursor, and lines written, at a time
+
+
+class Echo:
+    """File-like object that hands back what csv.writer writes to it"""
+
+    def write(self, value):
+        return value
+
+
+_csv_writer = csv.writer(Echo())
+
+
+def history_sets(named=False):
+    """Every set of every completed workout as HISTORY_COLUMNS tuples, oldest workout first"""
+    return (
+        Set.objects.filter(exercise__workout__completed=True)
+        .order_by("exercise__workout__date", "exercise__workout_id", "exercise__order", "exercise_id", "set_num")
+        .values_list(
+            "exercise__workout__date",
+            "exercise__workout_id",
+            "exercise__order",
+            "exercise__exercise__name",
+            "exercise__exercise__category",
+            "set_num",
+            "reps_or_secs",
+            "pounds",
+            "duration_secs",
+            "note",
+            named=named,
+        )
+    )
+
+
+def header(fmt: str) -> str:
+    return _csv_writer.writerow(HISTORY_COLUMNS) if fmt == "csv" else ""
+
+
+def line(fmt: str, values: tuple) -> str:
+    if fmt == "csv":
+        return _csv_writer.writerow(values)
+    return json.dumps({**dict(zip(HISTORY_COLUMNS, values)), "date": values[0].isoformat()}) + "\n"
+
+
+def stream(fmt: str) -> Iterable[str]:
+    """Write the full history in `fmt`, a chunk of lines at a time
+
+    Rows come through a server-side cursor where the database has them, so
+    memory use doesn't grow with the history. The output is what
+    import_history reads.
+    """
+    yield header(fmt)
+    rows = history_sets().iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    while chunk := list(islice(rows, EXPORT_CHUNK_SIZE)):
+        yield "".join(line(fmt, values) for values in chunk)
+
+
+async def astream(fmt: str) -> AsyncIterator[str]:
+    """Async counterpart of stream for the ASGI views
+
+    The rows are named tuples because in Django 5.1 aiterator() runs a plain
+    values_list() query on the event loop, which raises SynchronousOnlyOperation.
+    """
+    yield header(fmt)
+    lines = []
+    async for values in history_sets(named=True).aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+        lines.append(line(fmt, values))
+        if len(lines) == EXPORT_CHUNK_SIZE:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
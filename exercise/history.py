@@ -0,0 +1,101 @@
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import DenseRank, RowNumber
+
+from exercise.models import Set, WorkoutExercise
+
+
+def ordered_sets():
+    return Prefetch("sets", queryset=Set.objects.order_by("set_num"))
+
+
+def latest_workout_exercises(exercises, before=None, with_sets=False):
+    """Map exercise pk to the WorkoutExercise from its most recent completed workout
+
+    If `before` is given, only workouts dated earlier are considered. With
+    `with_sets`, each WorkoutExercise has its sets prefetched in order.
+    """
+    candidates = WorkoutExercise.objects.filter(exercise__in=exercises, workout__completed=True)
+    if before is not None:
+        candidates = candidates.filter(workout__date__lt=before)
+    if with_sets:
+        candidates = candidates.prefetch_related(ordered_sets())
+    ranked = (
+        candidates.select_related("workout", "exercise")
+        .annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=F("exercise_id"),
+                order_by=[F("workout__date").desc(), F("pk").desc()],
+            )
+        )
+        .filter(rank=1)
+    )
+    return {wo.exercise_id: wo for wo in ranked}
+
+
+def recent_history(exercises, depth):
+    """Map exercise pk to [(date, sets)] for its `depth` most recent completed workout dates, newest first.
+
+    A single query ranks each exercise's completed WorkoutExercises by workout
+    date, and a second loads the sets of the ones kept, so cost does not grow
+    with the number of sets in the history.
+    """
+    ranked = (
+        WorkoutExercise.objects.filter(exercise__in=exercises, workout__completed=True)
+        .select_related("exercise", "workout")
+        .prefetch_related(ordered_sets())
+        .annotate(
+            rank=Window(
+                DenseRank(),
+                partition_by=F("exercise_id"),
+                order_by=F("workout__date").desc(),
+            )
+        )
+        .filter(rank__lte=depth)
+        .order_by("-workout__date", "pk")
+    )
+    history = {}
+    for wo in ranked:
+        by_date = history.setdefault(wo.exercise_id, {})
+        by_date.setdefault(wo.workout.date, []).extend(wo.sets.all())
+    return {
+        exercise_pk: [(day, sorted(sets, key=lambda s: s.set_num)) for day, sets in by_date.items()]
+        for exercise_pk, by_date in history.items()
+    }
+
+
+def load_category_comparison(workout, category):
+    """Pair each exercise of `category` in `workout` with its previous performance
+
+    A past workout is compared with the last completed workout before it; the
+    active workout with the most recent completed one. Costs a fixed number of
+    queries however many exercises the category has.
+    """
+    exercises = list(
+        workout.exercises.filter(exercise__category=category)
+        .select_related("exercise")
+        .prefetch_related(ordered_sets())
+        .order_by("order")
+    )
+    if not exercises:
+        return []
+
+    previous = latest_workout_exercises(
+        [exercise.exercise_id for exercise in exercises],
+        before=workout.date if workout.completed else None,
+        with_sets=True,
+    )
+
+    exercise_data = []
+    for exercise in exercises:
+        last_exercise = previous.get(exercise.exercise_id)
+        exercise_data.append(
+            {
+                "exercise": exercise,
+                "current_sets": list(exercise.sets.all()),
+                "last_sets": list(last_exercise.sets.all()) if last_exercise else [],
+                "last_workout": last_exercise.workout if last_exercise else None,
+                "last_exercise": last_exercise,
+            }
+        )
+    return exercise_data
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Protocol
+
+import anthropic
+import httpx
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+@dataclass
+class CompletionRequest:
+    model: str
+    system: str
+    prompt: str
+    max_tokens: int
+    temperature: float = 0.7
+    output_tokens: int | None = None  # Filled in by the backend once the stream finishes
+
+
+class Backend(Protocol):
+    def stream(self, request: CompletionRequest) -> Iterable[str]: ...
+
+    def astream(self, request: CompletionRequest) -> AsyncIterator[str]: ...
+
+
+class AnthropicBackend:
+    """Streams from the Anthropic API through one pooled, keep-alive client per process
+
+    The client is thread-safe and shared by every thread; a forked worker
+    builds its own rather than reusing sockets inherited from the parent. The
+    async client is tied to the event loop it was created on, so each loop
+    gets its own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+        self._async_client = None
+        self._async_owner = None
+
+    @staticmethod
+    def client_options():
+        return {
+            "timeout": httpx.Timeout(settings.ANTHROPIC_TIMEOUT, connect=settings.ANTHROPIC_CONNECT_TIMEOUT),
+            "max_retries": settings.ANTHROPIC_MAX_RETRIES,
+        }
+
+    @staticmethod
+    def pool_limits():
+        return httpx.Limits(
+            max_connections=settings.ANTHROPIC_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS,
+        )
+
+    def get_client(self) -> anthropic.Client:
+        pid = os.getpid()
+        with self._lock:
+            if self._client is None or self._pid != pid:
+                self._client = anthropic.Client(
+                    http_client=anthropic.DefaultHttpxClient(limits=self.pool_limits()),
+                    **self.client_options(),
+                )
+                self._pid = pid
+            return self._client
+
+    def get_async_client(self) -> anthropic.AsyncClient:
+        owner = (os.getpid(), id(asyncio.get_running_loop()))
+        with self._lock:
+            if self._async_client is None or self._async_owner != owner:
+                self._async_client = anthropic.AsyncClient(
+                    http_client=anthropic.DefaultAsyncHttpxClient(limits=self.pool_limits()),
+                    **self.client_options(),
+                )
+                self._async_owner = owner
+            return self._async_client
+
+    @staticmethod
+    def message_options(request: CompletionRequest) -> dict:
+        return {
+            "model": request.model,
+            "max_tokens": request.max_tokens,
+            "temperature": request.temperature,
+            "system": request.system,
+            "messages": [{"role": "user", "content": request.prompt}],
+        }
+
+    def stream(self, request: CompletionRequest) -> Iterable[str]:
+        with self.get_client().messages.stream(**self.message_options(request)) as stream:
+            for message in stream:
+                if hasattr(message, "text"):
+                    # Just yield the text directly without buffering or chunking
+                    yield message.text
+            request.output_tokens = stream.get_final_message().usage.output_tokens
+
+    async def astream(self, request: CompletionRequest) -> AsyncIterator[str]:
+        async with self.get_async_client().messages.stream(**self.message_options(request)) as stream:
+            async for message in stream:
+                if hasattr(message, "text"):
+                    yield message.text
+            request.output_tokens = (await stream.get_final_message()).usage.output_tokens
+
+
+STUB_REPLY = "Solid work so far. Keep the same weight and aim for one more rep on the next set."
+
+
+class StubBackend:
+    """Replies with canned text without touching the network, for tests and benchmarks
+
+    COACH_STUB_DELAY adds a pause before each word to mimic streaming latency.
+    """
+
+    def stream(self, request: CompletionRequest) -> Iterable[str]:
+        words = STUB_REPLY.split(" ")
+        for i, word in enumerate(words):
+            if settings.COACH_STUB_DELAY:
+                time.sleep(settings.COACH_STUB_DELAY)
+            yield word if i == 0 else f" {word}"
+        request.output_tokens = len(words)
+
+    async def astream(self, request: CompletionRequest) -> AsyncIterator[str]:
+        words = STUB_REPLY.split(" ")
+        for i, word in enumerate(words):
+            if settings.COACH_STUB_DELAY:
+                await asyncio.sleep(settings.COACH_STUB_DELAY)
+            yield word if i == 0 else f" {word}"
+        request.output_tokens = len(words)
+
+
+_backends: dict[str, Backend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend() -> Backend:
+    """Return the process-wide instance of the COACH_LLM_BACKEND class"""
+    path = settings.COACH_LLM_BACKEND
+    with _backends_lock:
+        if path not in _backends:
+            _backends[path] = import_string(path)()
+        return _backends[path]
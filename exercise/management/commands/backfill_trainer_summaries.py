@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import anthropic
+from django.core.management.base import BaseCommand, CommandError
+
+from exercise import background, telemetry, trainer_summaries
+from exercise.coach import MODEL, TRAINER_SUMMARY_MAX_TOKENS, TRAINER_SUMMARY_PROMPT, build_trainer_summary_prompt
+from exercise.history import load_category_comparison
+from exercise.llm import CompletionRequest, get_backend
+from exercise.models import Exercise, TrainerSummary, Workout
+
+
+class RateLimiter:
+    """Space request starts evenly so no more than `per_minute` begin in any minute"""
+
+    def __init__(self, per_minute):
+        self.interval = 60 / per_minute
+        self.next_start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        time.sleep(start - now)
+
+
+class Command(BaseCommand):
+    help = "Generate and store trainer summaries for completed workouts that don't have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Summaries generated at once")
+        parser.add_argument("--rate", type=float, default=30, help="Maximum summaries started per minute")
+        parser.add_argument("--retries", type=int, default=3, help="Retries per summary after an API error")
+        parser.add_argument(
+            "--backoff", type=float, default=2.0, help="Seconds before the first retry; doubles each time"
+        )
+        parser.add_argument(
+            "--checkpoint",
+            type=Path,
+            default=Path("trainer_summaries.checkpoint"),
+            help="File recording finished (workout, category) pairs so an interrupted run can resume",
+        )
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1")
+        if options["rate"] <= 0:
+            raise CommandError("--rate must be positive")
+        if options["retries"] < 0 or options["backoff"] < 0:
+            raise CommandError("--retries and --backoff can't be negative")
+
+        checkpoint = options["checkpoint"]
+        done = set(TrainerSummary.objects.values_list("workout_id", "category"))
+        if checkpoint.exists():
+            done |= {tuple(json.loads(line)) for line in checkpoint.read_text().splitlines() if line}
+
+        jobs = [
+            (workout_pk, category)
+            for workout_pk in Workout.objects.filter(completed=True).order_by("date").values_list("pk", flat=True)
+            for category, _ in Exercise.CATEGORIES
+            if (workout_pk, category) not in done
+        ]
+        self.stdout.write(f"{len(jobs)} summaries to generate, {len(done)} already done")
+
+        self.limiter = RateLimiter(options["rate"])
+        self.retries = options["retries"]
+        self.backoff = options["backoff"]
+        started = time.monotonic()
+        generated = tokens = failed = 0
+        interrupted = False
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool, checkpoint.open("a") as checkpoint_file:
+            futures = {pool.submit(self.summarize, *job): job for job in jobs}
+            try:
+                for finished, future in enumerate(as_completed(futures), start=1):
+                    workout_pk, category = futures[future]
+                    try:
+                        output_tokens = future.result()
+                    except anthropic.APIError as e:
+                        failed += 1
+                        self.stderr.write(f"Workout {workout_pk} {category} failed: {e}")
+                        continue
+
+                    checkpoint_file.write(json.dumps([workout_pk, category]) + "\n")
+                    checkpoint_file.flush()
+                    if output_tokens is None:
+                        continue  # No exercises in this category
+                    generated += 1
+                    tokens += output_tokens
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f"[{finished}/{len(jobs)}] workout {workout_pk} {category}: "
+                        f"{generated / elapsed * 60:.1f} summaries/min, {tokens / elapsed:.1f} tokens/s"
+                    )
+            except KeyboardInterrupt:
+                interrupted = True
+                self.stderr.write("Interrupted; finishing the summaries under way")
+            finally:
+                # Leaving the block would otherwise wait for every queued job. Summaries already
+                # under way are still stored, and the next run skips them.
+                pool.shutdown(cancel_futures=True)
+
+        style = self.style.SUCCESS if not failed and not interrupted else self.style.WARNING
+        self.stdout.write(
+            style(
+                f"Generated {generated} summaries ({tokens} tokens), {failed} failed"
+                + (f"; interrupted, rerun to resume from {checkpoint}" if interrupted else "")
+            )
+        )
+
+    @background.closes_connections
+    def summarize(self, workout_pk, category):
+        """Generate and store one summary, returning its output token count (None if nothing to summarize)"""
+        workout = Workout.objects.get(pk=workout_pk)
+        exercise_data = load_category_comparison(workout, category)
+        if not exercise_data:
+            return None
+
+        prompt = build_trainer_summary_prompt(exercise_data)
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            request = CompletionRequest(MODEL, TRAINER_SUMMARY_PROMPT, prompt, TRAINER_SUMMARY_MAX_TOKENS)
+            call = telemetry.Call("trainer_summary_backfill", MODEL, prompt)
+            call.request = request
+            try:
+                text = "".join(call.track(get_backend().stream(request)))
+                break
+            except anthropic.APIError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2**attempt)
+
+        trainer_summaries.store(workout, category, exercise_data, text)
+        return request.output_tokens or 0
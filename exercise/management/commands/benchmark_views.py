@@ -0,0 +1,209 @@
+import itertools
+import json
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from exercise.models import CachedResponse, Exercise, Set, Workout, WorkoutExercise
+from exercise.telemetry import percentile
+from exercise.views import save_category
+
+
+class Rollback(Exception):
+    """Raised to undo everything a benchmark run wrote"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the workout views through the test client against the current database, "
+        "recording p50/p95 latency, query count and peak memory. Everything the run writes is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=30, help="Timed requests per endpoint")
+        parser.add_argument("--category", default="MAIN", help="Category whose pages are benchmarked")
+        parser.add_argument("--output", type=Path, help="Write the results to this JSON file")
+        parser.add_argument("--compare", type=Path, help="Baseline JSON file to check the results against")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="Fraction by which latency or memory may exceed the baseline before it counts as a regression",
+        )
+
+    def handle(self, *args, **options):
+        baseline = json.loads(options["compare"].read_text()) if options["compare"] else None
+        if not Workout.objects.filter(completed=True).exists():
+            raise CommandError("No completed workouts to benchmark; run generate_history first")
+
+        with override_settings(
+            COACH_LLM_BACKEND="exercise.llm.StubBackend", COACH_STUB_DELAY=0, COACH_SPECULATION=False
+        ):
+            try:
+                with transaction.atomic():
+                    results = self.run(options["category"], options["iterations"])
+                    raise Rollback
+            except Rollback:
+                pass
+
+        report = {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "database": connection.vendor,
+            "workouts": Workout.objects.filter(completed=True).count(),
+            "sets": Set.objects.count(),
+            "iterations": options["iterations"],
+            "results": results,
+        }
+        self.stdout.write(f"{report['workouts']} workouts, {report['sets']} sets on {report['database']}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<24} p50 {result['p50_ms']:8.2f}ms  p95 {result['p95_ms']:8.2f}ms  "
+                f"{result['queries']:3d} queries  {result['peak_memory_kb']:8.1f}KB peak"
+            )
+        if options["output"]:
+            options["output"].write_text(json.dumps(report, indent=2) + "\n")
+            self.stdout.write(f"Wrote {options['output']}")
+
+        if baseline is not None:
+            regressions = self.compare(results, baseline["results"], options["threshold"])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressions against {options['compare']}")
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}"))
+
+    def run(self, category, iterations):
+        """Benchmark every endpoint, returning their results by name"""
+        workout, exercise_pk = self.prepare_active_workout(category)
+        past = Workout.objects.filter(completed=True).latest("date")
+        set_page = reverse("workout_set", args=(2, exercise_pk))
+        exercise_id = WorkoutExercise.objects.get(pk=exercise_pk).exercise_id
+        client = Client()
+
+        def get(url):
+            return lambda: client.get(url)
+
+        def stream(url):
+            def request():
+                response = client.get(url)
+                b"".join(response.streaming_content)
+                return response
+
+            return request
+
+        def post_set():
+            return client.post(
+                set_page,
+                {"reps_or_secs": "8", "pounds": "100", "note": "", "duration_secs": "30", "next_url": set_page},
+            )
+
+        def clear_set():
+            Set.objects.filter(exercise_id=exercise_pk, set_num=2).delete()
+
+        block = list(workout.exercises.filter(exercise__category=category).values_list("pk", flat=True))
+        batches = itertools.count()
+
+        def sync_sets():
+            # Fresh idempotency keys every time, so each batch is written rather than skipped
+            batch = next(batches)
+            sets = [
+                {"key": f"benchmark-{batch}-{pk}", "exercise": pk, "set_num": 2, "reps_or_secs": 8, "pounds": 100}
+                for pk in block
+            ]
+            return client.post(reverse("sync_sets"), {"sets": sets}, content_type="application/json")
+
+        def clear_synced_sets():
+            Set.objects.filter(exercise__in=block, set_num=2).delete()
+
+        def clear_responses():
+            # Measure generating a reply, not replaying a cached one
+            CachedResponse.objects.all().delete()
+
+        endpoints = {
+            "choose_next_category": (get(reverse("choose_next_category", args=(category,))), None),
+            "next_category": (get(reverse("next_category", args=(category,))), None),
+            "workout_set": (get(set_page), None),
+            "workout_set_post": (post_set, clear_set),
+            "sync_sets": (sync_sets, clear_synced_sets),
+            "superset_bundle": (get(reverse("superset_bundle", args=(category,))), None),
+            "exercise_progress": (get(reverse("exercise_progress", args=(exercise_id,))), None),
+            "summarize_category": (get(reverse("summarize_category", args=(category,))), None),
+            "summarize_category_past": (get(reverse("summarize_category_past", args=(category, past.pk))), None),
+            "workout_summary": (get(reverse("workout_summary", args=(past.pk,))), None),
+            "coach_stream": (stream(reverse("coach_stream", args=(exercise_pk,))), clear_responses),
+            "trainer_summary_stream": (stream(reverse("trainer_summary_stream", args=(category,))), clear_responses),
+        }
+        return {name: self.measure(name, request, reset, iterations) for name, (request, reset) in endpoints.items()}
+
+    def prepare_active_workout(self, category):
+        """Start a fresh active workout repeating the last one, with the first set of each exercise logged
+
+        Returns the workout and the pk of the first WorkoutExercise in `category`.
+        """
+        Workout.objects.filter(completed=False).delete()
+        last = Workout.objects.filter(completed=True).latest("date")
+        for key, _ in Exercise.CATEGORIES:
+            exercises = last.exercises.filter(exercise__category=key).order_by("order")
+            save_category(key, list(exercises.values_list("exercise_id", flat=True)))
+        workout = Workout.objects.get(completed=False)
+        for wo in workout.exercises.all():
+            Set.objects.create(exercise=wo, set_num=1, reps_or_secs=8, pounds=100)
+        first = workout.exercises.filter(exercise__category=category).order_by("order").first()
+        if first is None:
+            raise CommandError(f"The last workout has no {category} exercises")
+        return workout, first.pk
+
+    def measure(self, name, request, reset, iterations):
+        """Time `iterations` requests after a warm-up, then count queries and peak memory in separate runs"""
+
+        def call():
+            if reset:
+                reset()
+            start = time.perf_counter()
+            response = request()
+            elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                raise CommandError(f"{name} returned {response.status_code}")
+            return elapsed
+
+        call()
+        timings = [call() for _ in range(iterations)]
+
+        # Query capture and memory tracing both slow requests down, so they get runs of their own
+        with CaptureQueriesContext(connection) as ctx:
+            call()
+        queries = len(ctx.captured_queries)
+        tracemalloc.start()
+        try:
+            call()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "p50_ms": round(percentile(timings, 50) * 1000, 3),
+            "p95_ms": round(percentile(timings, 95) * 1000, 3),
+            "queries": queries,
+            "peak_memory_kb": round(peak / 1024, 1),
+        }
+
+    def compare(self, results, baseline, threshold):
+        """Describe each way `results` is worse than `baseline`"""
+        regressions = []
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            before = baseline[name]
+            for metric in ("p50_ms", "p95_ms", "peak_memory_kb"):
+                if result[metric] > before[metric] * (1 + threshold):
+                    regressions.append(f"{name}: {metric} {before[metric]} -> {result[metric]}")
+            if result["queries"] > before["queries"]:
+                regressions.append(f"{name}: queries {before['queries']} -> {result['queries']}")
+        return regressions
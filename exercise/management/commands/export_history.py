@@ -0,0 +1,33 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exercise import export
+
+
+class Command(BaseCommand):
+    help = "Export every completed workout's sets, oldest first, as CSV or JSONL that import_history can read back"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format", choices=list(export.FORMATS), help="Output format; by default taken from --output"
+        )
+        parser.add_argument("--output", type=Path, help="File to write; standard output if not given")
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        fmt = options["format"] or (output.suffix.lstrip(".") if output else "csv")
+        if fmt not in export.FORMATS:
+            raise CommandError("Can't tell the output format; pass --format csv or --format jsonl")
+
+        if not output:
+            for chunk in export.stream(fmt):
+                self.stdout.write(chunk, ending="")
+            return
+
+        started = time.monotonic()
+        with output.open("w", newline="") as destination:
+            for chunk in export.stream(fmt):
+                destination.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {output} in {time.monotonic() - started:.1f}s"))
@@ -0,0 +1,168 @@
+import random
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from exercise import stats
+from exercise.bulk import insert_sets
+from exercise.models import Exercise, Workout, WorkoutExercise
+from exercise.views import SUPERSETS
+
+# Rep ranges worked through before the weight goes up, per category
+REP_RANGES = {
+    "COND": (10, 15),
+    "MAIN": (3, 6),
+    "ACCE": (8, 12),
+    "CORE": (10, 20),
+}
+
+
+@dataclass
+class Progression:
+    """Where one exercise's training has got to: the weight and reps of its next top set"""
+
+    exercise: Exercise
+    pounds: int | None
+    reps_or_secs: int
+    low: int
+    high: int
+    sessions: int = 0
+
+    def advance(self, rng):
+        """Move on after a session: add reps until the top of the range, then add weight; deload now and then"""
+        self.sessions += 1
+        if self.sessions % 24 == 0:
+            if self.pounds:
+                self.pounds = max(5, round(self.pounds * 0.9 / 5) * 5)
+            self.reps_or_secs = self.low
+        elif rng.random() < 0.7:
+            if self.reps_or_secs < self.high:
+                self.reps_or_secs += 5 if self.exercise.is_seconds else 1
+            elif self.pounds:
+                self.pounds += 10 if self.exercise.category == "MAIN" else 5
+                self.reps_or_secs = self.low
+            else:
+                self.low += 5 if self.exercise.is_seconds else 1
+                self.high += 5 if self.exercise.is_seconds else 1
+
+    def sets(self, workout_exercise, set_count, rng):
+        """Rows (in bulk.SET_COLUMNS order) for one session's sets, with reps dropping off a little as fatigue builds"""
+        reps = self.reps_or_secs
+        for set_num in range(1, set_count + 1):
+            if set_num > 1 and rng.random() < 0.3:
+                reps = max(1, reps - (5 if self.exercise.is_seconds else 1))
+            duration = reps if self.exercise.is_seconds else reps * (2 + 2 * rng.random())
+            yield (workout_exercise.pk, set_num, reps, self.pounds, "", int(duration + 10 * rng.random()))
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic training history for load and scale testing. "
+        "Creates its own exercises and completed workouts ending yesterday; meant for throwaway databases."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--exercises-per-category", type=int, default=6, help="Exercises created per category")
+        parser.add_argument(
+            "--exercises-per-workout", type=int, default=2, help="Exercises from each category in every workout"
+        )
+        parser.add_argument("--years", type=float, default=2, help="Years of history to generate")
+        parser.add_argument("--workouts-per-week", type=int, default=3, help="Workouts in each week, at most 7")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed, so runs are reproducible")
+        parser.add_argument("--batch-size", type=int, default=500, help="Workouts written per transaction")
+
+    def handle(self, *args, **options):
+        per_category = options["exercises_per_category"]
+        per_workout = options["exercises_per_workout"]
+        per_week = options["workouts_per_week"]
+        if not 1 <= per_week <= 7:
+            raise CommandError("--workouts-per-week must be between 1 and 7")
+        if not 1 <= per_workout <= per_category:
+            raise CommandError("--exercises-per-workout must be between 1 and --exercises-per-category")
+
+        rng = random.Random(options["seed"])
+        started = time.monotonic()
+        progressions = self.create_exercises(per_category, rng)
+        dates = self.workout_dates(options["years"], per_week)
+
+        workouts = sets = 0
+        batch_size = options["batch_size"]
+        for start in range(0, len(dates), batch_size):
+            batch = dates[start : start + batch_size]
+            sets += self.write_workouts(batch, progressions, per_workout, rng)
+            workouts += len(batch)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"{workouts}/{len(dates)} workouts, {sets} sets, {sets / elapsed:.0f} sets/s")
+
+        exercise_ids = [progression.exercise.pk for category in progressions.values() for progression in category]
+        stats.refresh(exercise_ids)
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {len(exercise_ids)} exercises, {workouts} workouts and {sets} sets in {elapsed:.1f}s"
+            )
+        )
+
+    def create_exercises(self, per_category, rng):
+        """Create the exercises, returning each category's progressions"""
+        progressions = {}
+        for category, name in Exercise.CATEGORIES:
+            low, high = REP_RANGES[category]
+            exercises = Exercise.objects.bulk_create(
+                Exercise(
+                    name=f"Synthetic {name} {i}",
+                    category=category,
+                    is_seconds=category in ("COND", "CORE") and rng.random() < 0.5,
+                    is_sides=category == "ACCE" and rng.random() < 0.3,
+                )
+                for i in range(1, per_category + 1)
+            )
+            progressions[category] = []
+            for exercise in exercises:
+                if exercise.is_seconds:
+                    pounds, exercise_low, exercise_high = None, low * 3, high * 3
+                else:
+                    pounds = rng.randrange(95, 230, 5) if category == "MAIN" else rng.randrange(0, 80, 5) or None
+                    exercise_low, exercise_high = low, high
+                progressions[category].append(Progression(exercise, pounds, exercise_low, exercise_low, exercise_high))
+        return progressions
+
+    def workout_dates(self, years, per_week):
+        """Training days, `per_week` to a week, from `years` ago up to yesterday"""
+        end = date.today() - timedelta(days=1)
+        day = end - timedelta(days=round(years * 365))
+        weekdays = [round(i * 7 / per_week) for i in range(per_week)]
+        dates = []
+        while day <= end:
+            if day.weekday() in weekdays:
+                dates.append(day)
+            day += timedelta(days=1)
+        return dates
+
+    @transaction.atomic
+    def write_workouts(self, dates, progressions, per_workout, rng):
+        """Write one batch of completed workouts with their exercises and sets, returning the set count"""
+        workouts = Workout.objects.bulk_create(Workout(date=day, completed=True) for day in dates)
+        sessions = []
+        for workout in workouts:
+            order = 1
+            for category, _ in Exercise.CATEGORIES:
+                for progression in rng.sample(progressions[category], per_workout):
+                    sessions.append(
+                        (
+                            WorkoutExercise(workout_id=workout.pk, exercise_id=progression.exercise.pk, order=order),
+                            progression,
+                        )
+                    )
+                    order += 1
+        WorkoutExercise.objects.bulk_create(workout_exercise for workout_exercise, _ in sessions)
+
+        new_sets = []
+        for workout_exercise, progression in sessions:
+            new_sets.extend(progression.sets(workout_exercise, SUPERSETS[progression.exercise.category], rng))
+            progression.advance(rng)
+        insert_sets(new_sets)
+        return len(new_sets)
@@ -0,0 +1,175 @@
+import csv
+import itertools
+import json
+import sys
+import time
+from contextlib import nullcontext
+from datetime import date
+from pathlib import Path
+from typing import NamedTuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from exercise import stats
+from exercise.bulk import HISTORY_COLUMNS, insert_sets
+from exercise.models import Exercise, Workout, WorkoutExercise
+
+
+class Row(NamedTuple):
+    """One set read from the input"""
+
+    line: int
+    date: date
+    workout: str | None  # Tells apart workouts on the same date; only grouped on, never stored
+    order: int | None
+    exercise_id: int
+    set_num: int | None
+    reps_or_secs: int | None
+    pounds: int | None
+    duration_secs: int | None
+    note: str
+
+
+class Command(BaseCommand):
+    help = (
+        "Import completed workouts from a CSV or JSONL file with one row per set, as written by export_history. "
+        f"Columns: {', '.join(HISTORY_COLUMNS)}; only date and exercise (by name) are required. "
+        "Rows are grouped into workouts by date, and by the optional workout column, which tells apart "
+        "workouts on the same date. A workout's rows must be contiguous, as they are when the file is sorted. "
+        "Each chunk is its own transaction, so chunks written before an error stay imported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - for standard input")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Input format; by default taken from the suffix")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Workouts written per transaction")
+        parser.add_argument(
+            "--create-exercises",
+            action="store_true",
+            help="Create exercises that don't exist yet, using the category column",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or Path(path).suffix.lstrip(".").lower()
+        if fmt not in ("csv", "jsonl"):
+            raise CommandError("Can't tell the input format; pass --format csv or --format jsonl")
+
+        self.exercises = {name.casefold(): pk for name, pk in Exercise.objects.values_list("name", "pk")}
+        self.create_exercises = options["create_exercises"]
+        self.touched = set()
+
+        started = time.monotonic()
+        workouts = sets = 0
+        with open(path, newline="") if path != "-" else nullcontext(sys.stdin) as source:
+            rows = (self.parse(line, record) for line, record in self.read(source, fmt))
+            by_workout = itertools.groupby(rows, key=lambda row: (row.date, row.workout))
+            while chunk := [list(group) for _, group in itertools.islice(by_workout, options["chunk_size"])]:
+                sets += self.write(chunk)
+                workouts += len(chunk)
+                self.stdout.write(f"{workouts} workouts, {sets} sets, {self.rate(sets, started):.0f} rows/s")
+
+        stats.refresh(list(self.touched))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {workouts} workouts and {sets} sets in {time.monotonic() - started:.1f}s "
+                f"({self.rate(sets, started):.0f} rows/s)"
+            )
+        )
+
+    def rate(self, rows, started):
+        return rows / max(time.monotonic() - started, 1e-6)
+
+    def read(self, source, fmt):
+        """Yield (line number, record dict) for each row of the input"""
+        if fmt == "csv":
+            reader = csv.DictReader(source)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line, text in enumerate(source, start=1):
+                if text.strip():
+                    try:
+                        yield line, json.loads(text)
+                    except json.JSONDecodeError as e:
+                        raise CommandError(f"Line {line}: {e}") from e
+
+    def parse(self, line, record):
+        try:
+            return Row(
+                line=line,
+                date=date.fromisoformat(str(record["date"])),
+                workout=optional_str(record.get("workout")),
+                order=optional_int(record.get("order")),
+                exercise_id=self.resolve(record["exercise"], record.get("category")),
+                set_num=optional_int(record.get("set_num")),
+                reps_or_secs=optional_int(record.get("reps_or_secs")),
+                pounds=optional_int(record.get("pounds")),
+                duration_secs=optional_int(record.get("duration_secs")),
+                note=record.get("note") or "",
+            )
+        except KeyError as e:
+            raise CommandError(f"Line {line}: missing {e.args[0]}") from e
+        except ValueError as e:
+            raise CommandError(f"Line {line}: {e}") from e
+
+    def resolve(self, name, category):
+        """Exercise pk for a name, from the lookup table loaded up front"""
+        name = str(name).strip()
+        key = name.casefold()
+        if key not in self.exercises:
+            if not self.create_exercises:
+                raise ValueError(f"unknown exercise {name!r} (pass --create-exercises to add it)")
+            if category not in dict(Exercise.CATEGORIES):
+                raise ValueError(f"can't create exercise {name!r} without a valid category")
+            self.exercises[key] = Exercise.objects.create(name=name, category=category).pk
+        return self.exercises[key]
+
+    @transaction.atomic
+    def write(self, chunk):
+        """Write a chunk of workouts, each a list of its rows, as completed workouts, returning the number of sets"""
+        workouts = Workout.objects.bulk_create(Workout(date=rows[0].date, completed=True) for rows in chunk)
+        workout_exercises = []
+        sets = []
+        for workout, rows in zip(workouts, chunk):
+            by_exercise = {}
+            last_set_nums = {}
+            seen = set()
+            for row in rows:
+                if row.exercise_id not in by_exercise:
+                    by_exercise[row.exercise_id] = WorkoutExercise(
+                        workout_id=workout.pk,
+                        exercise_id=row.exercise_id,
+                        order=row.order if row.order is not None else len(by_exercise) + 1,
+                    )
+                    workout_exercises.append(by_exercise[row.exercise_id])
+                    self.touched.add(row.exercise_id)
+                set_num = row.set_num if row.set_num is not None else last_set_nums.get(row.exercise_id, 0) + 1
+                if (row.exercise_id, set_num) in seen:
+                    raise CommandError(
+                        f"Line {row.line}: set {set_num} of this exercise is already in the workout on {row.date}"
+                        + ("; give each workout on a date its own workout value" if row.workout is None else "")
+                    )
+                seen.add((row.exercise_id, set_num))
+                last_set_nums[row.exercise_id] = set_num
+                sets.append((by_exercise[row.exercise_id], set_num, row))
+        WorkoutExercise.objects.bulk_create(workout_exercises)
+
+        set_rows = [
+            (wo.pk, set_num, row.reps_or_secs, row.pounds, row.note, row.duration_secs) for wo, set_num, row in sets
+        ]
+        insert_sets(set_rows)
+        return len(set_rows)
+
+
+def optional_str(value):
+    if value is None or value == "":
+        return None
+    return str(value)
+
+
+def optional_int(value):
+    if value is None or value == "":
+        return None
+    return int(value)
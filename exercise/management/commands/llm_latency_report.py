@@ -0,0 +1,61 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from exercise.models import LLMCall
+from exercise.telemetry import percentile
+
+PERCENTILES = (50, 95, 99)
+
+
+class Command(BaseCommand):
+    help = "Report LLM latency percentiles per endpoint and per model from the recorded calls"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, default=7, help="How far back to look")
+        parser.add_argument(
+            "--include-cached",
+            action="store_true",
+            help="Include replies served from the response cache or a shared stream in the percentiles",
+        )
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options["days"])
+        calls = list(LLMCall.objects.filter(created__gte=since).order_by())
+        self.stdout.write(f"{len(calls)} LLM calls since {since:%Y-%m-%d %H:%M}")
+        if not calls:
+            return
+
+        for label in ("endpoint", "model"):
+            groups = defaultdict(list)
+            for call in calls:
+                groups[getattr(call, label)].append(call)
+            self.stdout.write(f"\nBy {label}:")
+            self.stdout.write(
+                f"  {'':<24} {'calls':>6} {'cached':>7} {'cancel':>7} {'error':>6}  "
+                f"{'ttft ms p50/95/99':>20}  {'total ms p50/95/99':>20}  {'tok/s p50/95/99':>16}  {'prompt':>7}"
+            )
+            for name, group in sorted(groups.items()):
+                self.stdout.write(self.row(name, group, options["include_cached"]))
+
+    def row(self, name, calls, include_cached):
+        cached = sum(call.cache != "miss" for call in calls)
+        cancelled = sum(call.outcome == "cancelled" for call in calls)
+        errors = sum(call.outcome == "error" for call in calls)
+        measured = [call for call in calls if include_cached or call.cache == "miss"]
+        ttfts = [call.ttft_ms for call in measured if call.ttft_ms is not None]
+        durations = [call.duration_ms for call in measured if call.outcome == "completed"]
+        rates = [call.tokens_per_sec for call in measured if call.tokens_per_sec is not None]
+        prompt = sum(call.prompt_chars for call in calls) // len(calls)
+        return (
+            f"  {name:<24} {len(calls):>6} {cached / len(calls):>7.0%} {cancelled:>7} {errors:>6}  "
+            f"{self.percentiles(ttfts):>20}  {self.percentiles(durations):>20}  {self.percentiles(rates):>16}  "
+            f"{prompt:>7}"
+        )
+
+    def percentiles(self, samples):
+        if not samples:
+            return "-"
+        return "/".join(f"{percentile(samples, p):.0f}" for p in PERCENTILES)
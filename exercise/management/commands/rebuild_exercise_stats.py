@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from exercise import stats
+from exercise.models import Exercise
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-exercise stats (last workout, last sets, personal records) from the full history"
+
+    def handle(self, *args, **options):
+        exercise_ids = list(Exercise.objects.values_list("pk", flat=True))
+        stats.refresh(exercise_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {len(exercise_ids)} exercises."))
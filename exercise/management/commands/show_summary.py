@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from exercise.views import get_exercise_summary
+from exercise.views import get_exercise_summary, SUMMARY_HISTORY_DEPTH
 
 
 class Command(BaseCommand):
@@ -7,8 +7,11 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("exercise_id", type=int)
+        parser.add_argument(
+            "--history", type=int, default=SUMMARY_HISTORY_DEPTH, help="Number of previous workouts to show"
+        )
 
     def handle(self, *args, **options):
         exercise_id = options["exercise_id"]
-        for line in get_exercise_summary(exercise_id):
+        for line in get_exercise_summary(exercise_id, options["history"]):
             self.stdout.write(line)
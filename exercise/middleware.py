@@ -0,0 +1,91 @@
+import json
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from exercise import timing
+
+logger = logging.getLogger("exercise.timing")
+
+
+class ServerTimingMiddleware:
+    """Report where each request's time went in a Server-Timing header
+
+    Covers SQL (time and query count), template rendering and the view as a
+    whole. A streamed response's headers go out before its body is generated,
+    so its header only covers the view call; SQL, stream and LLM
+    time-to-first-token for the body are recorded as the stream runs and show
+    up in the SERVER_TIMING_LOG line once it finishes.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = timing.Timings()
+        token = timing.current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.current.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = timing.Timings()
+        token = timing.current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.current.reset(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        timings.add("view", timings.elapsed())
+        response["Server-Timing"] = timings.header()
+        if not response.streaming:
+            self.log(request, response, timings)
+        elif response.is_async:
+            response.streaming_content = self.atimed_stream(response.streaming_content, request, response, timings)
+        else:
+            response.streaming_content = self.timed_stream(response.streaming_content, request, response, timings)
+        return response
+
+    def timed_stream(self, content, request, response, timings):
+        token = timing.current.set(timings)
+        try:
+            yield from content
+        finally:
+            timing.current.reset(token)
+            timings.add("stream", timings.elapsed())
+            self.log(request, response, timings)
+
+    async def atimed_stream(self, content, request, response, timings):
+        token = timing.current.set(timings)
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            timing.current.reset(token)
+            timings.add("stream", timings.elapsed())
+            self.log(request, response, timings)
+
+    def log(self, request, response, timings):
+        if settings.SERVER_TIMING_LOG:
+            logger.info(
+                json.dumps(
+                    {
+                        "method": request.method,
+                        "path": request.path,
+                        "status": response.status_code,
+                        **timings.as_dict(),
+                    }
+                )
+            )
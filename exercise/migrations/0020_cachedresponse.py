@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 06:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("exercise", "0019_set_duration_secs"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CachedResponse",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("model", models.CharField(max_length=64)),
+                ("text", models.TextField()),
+                ("created", models.DateTimeField()),
+                ("last_used", models.DateTimeField()),
+            ],
+        ),
+    ]
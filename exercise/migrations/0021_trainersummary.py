@@ -0,0 +1,46 @@
+# Generated by Django 5.1 on 2026-10-18 07:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("exercise", "0020_cachedresponse"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrainerSummary",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "category",
+                    models.CharField(
+                        choices=[
+                            ("COND", "Conditioning"),
+                            ("MAIN", "Main Lift"),
+                            ("ACCE", "Accessory Lift"),
+                            ("CORE", "Core"),
+                        ],
+                        max_length=4,
+                    ),
+                ),
+                ("prompt_hash", models.CharField(max_length=64)),
+                ("model", models.CharField(max_length=64)),
+                ("text", models.TextField()),
+                ("created", models.DateTimeField(auto_now=True)),
+                (
+                    "workout",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="trainer_summaries",
+                        to="exercise.workout",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("workout", "category")},
+            },
+        ),
+    ]
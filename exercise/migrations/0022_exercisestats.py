@@ -0,0 +1,47 @@
+# Generated by Django 5.1 on 2026-10-18 08:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("exercise", "0021_trainersummary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExerciseStats",
+            fields=[
+                (
+                    "exercise",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="exercise.exercise",
+                    ),
+                ),
+                ("last_date", models.DateField(blank=True, null=True)),
+                (
+                    "last_sets",
+                    models.JSONField(
+                        blank=True, default=list, help_text="Rendered sets from the last completed workout"
+                    ),
+                ),
+                ("best_pounds", models.PositiveIntegerField(blank=True, null=True)),
+                ("best_reps_or_secs", models.PositiveIntegerField(blank=True, null=True)),
+                (
+                    "last_workout_exercise",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="exercise.workoutexercise",
+                    ),
+                ),
+            ],
+        ),
+    ]
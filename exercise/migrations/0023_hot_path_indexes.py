@@ -0,0 +1,20 @@
+# Generated by Django 5.1 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("exercise", "0022_exercisestats"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="workout",
+            index=models.Index(fields=["completed", "date"], name="workout_completed_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="workoutexercise",
+            index=models.Index(fields=["exercise", "workout"], name="workoutexercise_exercise_idx"),
+        ),
+    ]
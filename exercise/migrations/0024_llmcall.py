@@ -0,0 +1,51 @@
+# Generated by Django 5.1 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("exercise", "0023_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LLMCall",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("endpoint", models.CharField(max_length=32)),
+                ("model", models.CharField(max_length=64)),
+                (
+                    "cache",
+                    models.CharField(
+                        choices=[
+                            ("miss", "Miss"),
+                            ("hit", "Response cache hit"),
+                            ("shared", "Joined an in-flight stream"),
+                        ],
+                        max_length=6,
+                    ),
+                ),
+                (
+                    "outcome",
+                    models.CharField(
+                        choices=[("completed", "Completed"), ("cancelled", "Cancelled"), ("error", "Error")],
+                        max_length=9,
+                    ),
+                ),
+                ("prompt_chars", models.PositiveIntegerField()),
+                (
+                    "ttft_ms",
+                    models.PositiveIntegerField(
+                        blank=True, help_text="Time to first token; empty if none came", null=True
+                    ),
+                ),
+                ("duration_ms", models.PositiveIntegerField()),
+                (
+                    "output_tokens",
+                    models.PositiveIntegerField(blank=True, help_text="Only known for upstream calls", null=True),
+                ),
+            ],
+        ),
+    ]
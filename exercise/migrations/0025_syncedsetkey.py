@@ -0,0 +1,20 @@
+# Generated by Django 5.1 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("exercise", "0024_llmcall"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncedSetKey",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1 on 2026-10-18 16:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("exercise", "0025_syncedsetkey"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="workoutexercise",
+            name="exercise",
+            field=models.ForeignKey(
+                db_index=False, on_delete=django.db.models.deletion.PROTECT, to="exercise.exercise"
+            ),
+        ),
+    ]
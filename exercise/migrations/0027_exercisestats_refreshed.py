@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 16:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("exercise", "0026_drop_workoutexercise_exercise_fk_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="exercisestats",
+            name="refreshed",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                help_text="When the row was last recomputed from the history",
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("exercise", "0027_exercisestats_refreshed"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="workout",
+            name="workout_completed_date_idx",
+        ),
+        migrations.AddIndex(
+            model_name="workout",
+            index=models.Index(fields=["date"], name="workout_date_idx"),
+        ),
+    ]
@@ -45,6 +45,11 @@ class Workout(models.Model):
                 name="completed_workout_date_not_null",
             ),
         ]
+        indexes = [
+            # Views look for workouts by date, most of them only completed ones. All but the active
+            # workout are completed, so scans in date order filter out next to nothing.
+            models.Index(fields=["date"], name="workout_date_idx"),
+        ]
 
 
 class WorkoutExercise(models.Model):
@@ -52,9 +57,16 @@ class WorkoutExercise(models.Model):
     exercise = models.ForeignKey(
         Exercise,
         on_delete=models.PROTECT,
+        db_index=False,  # Covered by workoutexercise_exercise_idx, which leads with exercise
     )
     order = models.PositiveIntegerField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # History lookups go from an exercise to the workouts it appears in
+            models.Index(fields=["exercise", "workout"], name="workoutexercise_exercise_idx"),
+        ]
+
     @property
     def name(self):
         return self.exercise.name
@@ -118,3 +130,94 @@ class Set(models.Model):
             weight_str += f" {self.note}"
 
         return f"{rep_str}{weight_str} {self.exercise}"
+
+
+class ExerciseStats(models.Model):
+    """Denormalized per-exercise performance, kept current as sets are saved and workouts completed"""
+
+    exercise = models.OneToOneField(Exercise, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    last_workout_exercise = models.ForeignKey(
+        WorkoutExercise, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    last_date = models.DateField(null=True, blank=True)
+    last_sets = models.JSONField(default=list, blank=True, help_text="Rendered sets from the last completed workout")
+    best_pounds = models.PositiveIntegerField(null=True, blank=True)
+    best_reps_or_secs = models.PositiveIntegerField(null=True, blank=True)
+    refreshed = models.DateTimeField(auto_now=True, help_text="When the row was last recomputed from the history")
+
+    def __str__(self):
+        return f"Stats for {self.exercise}"
+
+
+class CachedResponse(models.Model):
+    """LLM output stored under a hash of the exact model, system prompt and prompt"""
+
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=64)
+    text = models.TextField()
+    created = models.DateTimeField()
+    last_used = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.model} {self.key[:12]}"
+
+
+class TrainerSummary(models.Model):
+    """Trainer analysis of one category of a completed workout, with the prompt it was generated from"""
+
+    workout = models.ForeignKey(Workout, on_delete=models.CASCADE, related_name="trainer_summaries")
+    category = models.CharField(max_length=4, choices=Exercise.CATEGORIES)
+    prompt_hash = models.CharField(max_length=64)
+    model = models.CharField(max_length=64)
+    text = models.TextField()
+    created = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ["workout", "category"]
+
+    def __str__(self):
+        return f"{Exercise.get_category_name(self.category)} on {self.workout}"
+
+
+class LLMCall(models.Model):
+    """Timing of one LLM request as the code that made it saw it, for latency reporting"""
+
+    CACHE_RESULTS = (
+        ("miss", "Miss"),
+        ("hit", "Response cache hit"),
+        ("shared", "Joined an in-flight stream"),
+    )
+    OUTCOMES = (
+        ("completed", "Completed"),
+        ("cancelled", "Cancelled"),
+        ("error", "Error"),
+    )
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    endpoint = models.CharField(max_length=32)
+    model = models.CharField(max_length=64)
+    cache = models.CharField(max_length=6, choices=CACHE_RESULTS)
+    outcome = models.CharField(max_length=9, choices=OUTCOMES)
+    prompt_chars = models.PositiveIntegerField()
+    ttft_ms = models.PositiveIntegerField(null=True, blank=True, help_text="Time to first token; empty if none came")
+    duration_ms = models.PositiveIntegerField()
+    output_tokens = models.PositiveIntegerField(null=True, blank=True, help_text="Only known for upstream calls")
+
+    @property
+    def tokens_per_sec(self) -> float | None:
+        """Output rate once tokens started arriving"""
+        if not self.output_tokens or self.ttft_ms is None or self.duration_ms <= self.ttft_ms:
+            return None
+        return self.output_tokens / (self.duration_ms - self.ttft_ms) * 1000
+
+    def __str__(self):
+        return f"{self.endpoint} {self.model} {self.cache} {self.outcome} in {self.duration_ms}ms"
+
+
+class SyncedSetKey(models.Model):
+    """Idempotency key of a set write synced from a client, kept so a replay of it is skipped"""
+
+    key = models.CharField(max_length=64, unique=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,40 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.utils import timezone
+
+from exercise.models import CachedResponse
+
+RESPONSE_CACHE_TTL = timedelta(days=7)
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+
+
+def cache_key(model: str, system: str, prompt: str) -> str:
+    return hashlib.sha256(json.dumps([model, system, prompt]).encode()).hexdigest()
+
+
+def get(key: str) -> str | None:
+    """Return the stored text for key if it hasn't expired, marking it as recently used"""
+    now = timezone.now()
+    try:
+        entry = CachedResponse.objects.get(key=key, created__gte=now - RESPONSE_CACHE_TTL)
+    except CachedResponse.DoesNotExist:
+        return None
+    CachedResponse.objects.filter(pk=entry.pk).update(last_used=now)
+    return entry.text
+
+
+def store(key: str, model: str, text: str):
+    now = timezone.now()
+    CachedResponse.objects.update_or_create(
+        key=key, defaults={"model": model, "text": text, "created": now, "last_used": now}
+    )
+    cull()
+
+
+def cull():
+    """Drop expired entries, then the least recently used ones beyond the size limit"""
+    CachedResponse.objects.filter(created__lt=timezone.now() - RESPONSE_CACHE_TTL).delete()
+    overflow = CachedResponse.objects.order_by("-last_used").values_list("pk", flat=True)[RESPONSE_CACHE_MAX_ENTRIES:]
+    CachedResponse.objects.filter(pk__in=list(overflow)).delete()
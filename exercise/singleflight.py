@@ -0,0 +1,129 @@
+import asyncio
+import threading
+from collections import Counter
+
+_lock = threading.Lock()
+_flights = {}
+_stats = Counter()
+
+
+class Flight:
+    """One upstream LLM stream whose output is shared with every request for the same prompt
+
+    Subscribers first get everything produced so far, then follow along live,
+    from threads (follow) or from coroutines (afollow).
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.failed = False  # The upstream stream raised; chunks are all that arrived before it did
+        self.subscribers = 0  # Requests reading the stream, the one driving it included
+        self.task = None  # Keeps the driving task alive when the stream runs on an event loop
+        self._condition = threading.Condition()
+        self._async_waiters = []
+
+    def _notify(self):
+        # Called with the condition held
+        self._condition.notify_all()
+        for loop, waiter in self._async_waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+        self._async_waiters = []
+
+    def publish(self, text: str):
+        with self._condition:
+            self.chunks.append(text)
+            self._notify()
+
+    def finish(self):
+        with self._condition:
+            self.done = True
+            self._notify()
+
+    def leave(self):
+        """Stop counting the caller as a subscriber"""
+        with _lock:
+            self.subscribers -= 1
+
+    def follow(self):
+        sent = 0
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self.done or len(self.chunks) > sent)
+                    chunks = self.chunks[sent:]
+                    finished = self.done
+                yield from chunks
+                sent += len(chunks)
+                if finished:
+                    return
+        finally:
+            self.leave()
+
+    async def afollow(self):
+        sent = 0
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                with self._condition:
+                    chunks = self.chunks[sent:]
+                    finished = self.done
+                    waiter = None
+                    if not chunks and not finished:
+                        waiter = loop.create_future()
+                        self._async_waiters.append((loop, waiter))
+                if waiter:
+                    await waiter
+                    continue
+                for text in chunks:
+                    yield text
+                sent += len(chunks)
+                if finished:
+                    return
+        finally:
+            self.leave()
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def join(key: str) -> tuple[Flight, bool]:
+    """Return the in-flight stream for key and whether the caller must drive it
+
+    The caller is counted as a subscriber until it leaves, which follow and
+    afollow do when they finish or are closed.
+    """
+    with _lock:
+        if flight := _flights.get(key):
+            flight.subscribers += 1
+            _stats["shared"] += 1
+            return flight, False
+        flight = _flights[key] = Flight()
+        flight.subscribers = 1
+        _stats["led"] += 1
+        return flight, True
+
+
+def abandon(key: str, flight: Flight) -> bool:
+    """Stop handing out flight if nobody is subscribed to it, and return whether it was dropped"""
+    with _lock:
+        if flight.subscribers:
+            return False
+        if _flights.get(key) is flight:
+            del _flights[key]
+        return True
+
+
+def land(key: str, flight: Flight):
+    """Mark the flight finished and stop handing it out"""
+    with _lock:
+        if _flights.get(key) is flight:
+            del _flights[key]
+    flight.finish()
+
+
+def get_stats() -> dict:
+    with _lock:
+        return {"led": _stats["led"], "shared": _stats["shared"], "in_flight": len(_flights)}
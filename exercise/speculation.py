@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import Counter
+
+from exercise import background
+from exercise.coach import get_coach_response
+
+SPECULATION_WORKERS = 2
+SPECULATION_TTL = 10 * 60  # Seconds an unclaimed speculation stays usable
+
+
+class Speculation:
+    """A coach response generated ahead of the set page that will show it
+
+    The response goes through the usual single-flight stream and response
+    cache, so the set page's coach_stream attaches to it simply by asking for
+    the same prompt. The summary is built in the worker too, keeping it off
+    the request that logged the set.
+    """
+
+    def __init__(self, exercise_pk: int):
+        self.exercise_pk = exercise_pk
+        self.summary_lines = None  # Set by run once the summary is built
+        self.started = time.monotonic()
+        self.cancelled = False
+        self.future = None
+
+    @property
+    def expired(self):
+        return time.monotonic() - self.started > SPECULATION_TTL
+
+    @background.closes_connections
+    def run(self):
+        # Imported here because views imports this module
+        from exercise.views import get_exercise_summary
+
+        if self.cancelled:
+            return
+        self.summary_lines = get_exercise_summary(self.exercise_pk)
+        for _ in get_coach_response(self.summary_lines, endpoint="coach_speculation"):
+            if self.cancelled:
+                break
+
+    def cancel(self):
+        self.cancelled = True
+        if self.future:
+            self.future.cancel()
+
+
+_lock = threading.Lock()
+_speculations: dict[int, Speculation] = {}
+_stats = Counter()
+
+
+def get_executor():
+    return background.get_executor("coach-speculation", SPECULATION_WORKERS)
+
+
+def speculate(exercise_pk: int):
+    """Start generating the coach response for a set page the user is about to open
+
+    Speculations the user has moved past are cancelled, since their pages were skipped.
+    """
+    speculation = Speculation(exercise_pk)
+    with _lock:
+        for abandoned in _speculations.values():
+            abandoned.cancel()
+            _stats["cancelled"] += 1
+        _speculations.clear()
+        _speculations[exercise_pk] = speculation
+        _stats["started"] += 1
+    speculation.future = get_executor().submit(speculation.run)
+
+
+def claim(exercise_pk: int, summary_lines: list[str]) -> bool:
+    """Record whether a speculation for this exercise was built from the same summary
+
+    A stale speculation, or one that hasn't built its summary yet, is
+    cancelled; the caller streams the response as usual either way.
+    """
+    with _lock:
+        speculation = _speculations.pop(exercise_pk, None)
+        if speculation and speculation.summary_lines == summary_lines and not speculation.expired:
+            _stats["hits"] += 1
+            return True
+        if speculation:
+            speculation.cancel()
+            _stats["cancelled"] += 1
+        _stats["misses"] += 1
+    return False
+
+
+def get_stats() -> dict:
+    with _lock:
+        return {
+            "started": _stats["started"],
+            "hits": _stats["hits"],
+            "misses": _stats["misses"],
+            "cancelled": _stats["cancelled"],
+            "pending": len(_speculations),
+        }
@@ -0,0 +1,124 @@
+from django.db.models import Max
+
+from exercise.history import latest_workout_exercises
+from exercise.models import ExerciseStats, Set
+
+
+def refresh(exercise_ids, exclude_sets=()):
+    """Recompute the stats rows for these exercises from their history, creating missing ones
+
+    exclude_sets leaves sets out of the personal records, so sets that were
+    just saved can still be compared against what came before them.
+    """
+    latest = latest_workout_exercises(exercise_ids, with_sets=True)
+    history = Set.objects.filter(exercise__exercise__in=exercise_ids)
+    if exclude_sets:
+        history = history.exclude(pk__in=exclude_sets)
+    bests = {
+        row["exercise__exercise_id"]: row
+        for row in history.values("exercise__exercise_id").annotate(
+            best_pounds=Max("pounds"), best_reps_or_secs=Max("reps_or_secs")
+        )
+    }
+
+    rows = []
+    for exercise_id in exercise_ids:
+        last = latest.get(exercise_id)
+        best = bests.get(exercise_id, {})
+        rows.append(
+            ExerciseStats(
+                exercise_id=exercise_id,
+                last_workout_exercise=last,
+                last_date=last.workout.date if last else None,
+                last_sets=[s.render() for s in last.sets.all()] if last else [],
+                best_pounds=best.get("best_pounds"),
+                best_reps_or_secs=best.get("best_reps_or_secs"),
+            )
+        )
+    ExerciseStats.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["exercise"],
+        update_fields=[
+            "last_workout_exercise",
+            "last_date",
+            "last_sets",
+            "best_pounds",
+            "best_reps_or_secs",
+            "refreshed",
+        ],
+    )
+    return {row.exercise_id: row for row in rows}
+
+
+def get_many(exercise_ids) -> dict[int, ExerciseStats]:
+    """Map exercise pk to its stats row, filling in any that don't exist yet"""
+    stats = ExerciseStats.objects.select_related(
+        "last_workout_exercise__workout", "last_workout_exercise__exercise"
+    ).in_bulk(exercise_ids)
+    if missing := [pk for pk in exercise_ids if pk not in stats]:
+        stats.update(refresh(missing))
+    return stats
+
+
+def get(exercise_id) -> ExerciseStats:
+    return get_many([exercise_id])[exercise_id]
+
+
+def record_set(set_instance) -> list[str]:
+    """Fold a just-saved set into its exercise's stats, returning descriptions of any records it set"""
+    wo = set_instance.exercise
+    stats = ExerciseStats.objects.filter(pk=wo.exercise_id).first()
+    if stats is None:
+        stats = refresh([wo.exercise_id], exclude_sets=[set_instance.pk])[wo.exercise_id]
+
+    records = describe_records(set_instance, stats)
+    if wo.workout.completed:
+        # Editing a past workout can change its last sets as well as the records
+        refresh([wo.exercise_id])
+    else:
+        fold_bests(stats, set_instance)
+        stats.save(update_fields=["best_pounds", "best_reps_or_secs"])
+    return records
+
+
+def record_sets(set_instances) -> list[str]:
+    """Batch counterpart of record_set for sets saved together
+
+    Each set is compared against the records from before the batch plus the
+    sets ahead of it in the batch. Stats are written back in one query, or
+    refreshed together for exercises with sets in completed workouts.
+    """
+    exercise_ids = list({s.exercise.exercise_id for s in set_instances})
+    stats = ExerciseStats.objects.in_bulk(exercise_ids)
+    if missing := [pk for pk in exercise_ids if pk not in stats]:
+        stats.update(refresh(missing, exclude_sets=[s.pk for s in set_instances]))
+
+    records = []
+    for set_instance in set_instances:
+        row = stats[set_instance.exercise.exercise_id]
+        records.extend(describe_records(set_instance, row))
+        fold_bests(row, set_instance)
+
+    edited_past = {s.exercise.exercise_id for s in set_instances if s.exercise.workout.completed}
+    if edited_past:
+        refresh(list(edited_past))
+    if current := [row for pk, row in stats.items() if pk not in edited_past]:
+        ExerciseStats.objects.bulk_update(current, ["best_pounds", "best_reps_or_secs"])
+    return records
+
+
+def describe_records(set_instance, stats) -> list[str]:
+    wo = set_instance.exercise
+    records = []
+    label = "secs" if wo.is_seconds else "reps"
+    if stats.best_pounds is not None and (set_instance.pounds or 0) > stats.best_pounds:
+        records.append(f"Heaviest {wo.name} yet: {set_instance.pounds} lbs")
+    if stats.best_reps_or_secs is not None and (set_instance.reps_or_secs or 0) > stats.best_reps_or_secs:
+        records.append(f"Most {label} on {wo.name} yet: {set_instance.reps_or_secs}")
+    return records
+
+
+def fold_bests(stats, set_instance):
+    stats.best_pounds = max(filter(None, [stats.best_pounds, set_instance.pounds]), default=None)
+    stats.best_reps_or_secs = max(filter(None, [stats.best_reps_or_secs, set_instance.reps_or_secs]), default=None)
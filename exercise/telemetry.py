@@ -0,0 +1,81 @@
+import asyncio
+import math
+import time
+from typing import AsyncIterator, Iterable
+
+from asgiref.sync import sync_to_async
+
+from exercise.models import LLMCall
+
+
+class Call:
+    """One LLM request as its caller sees it, saved as an LLMCall once the caller is done with it
+
+    The code serving the request sets `cache` to say where the text came from,
+    and for upstream calls `request`, whose output_tokens the backend fills in.
+    """
+
+    def __init__(self, endpoint: str, model: str, prompt: str):
+        self.endpoint = endpoint
+        self.model = model
+        self.prompt_chars = len(prompt)
+        self.cache = "miss"
+        self.request = None
+        self.flight = None  # The shared stream followed, if any; it knows whether the upstream call failed
+        self.outcome = "completed"
+        self.started = time.perf_counter()
+        self.ttft = None
+
+    def track(self, chunks: Iterable[str]) -> Iterable[str]:
+        """Pass chunks through, noting the first one's arrival and how the stream ended"""
+        try:
+            for chunk in chunks:
+                self.arrived()
+                yield chunk
+        except GeneratorExit:
+            self.outcome = "cancelled"
+            raise
+        except Exception:
+            self.outcome = "error"
+            raise
+        finally:
+            self.save()
+
+    async def atrack(self, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Async counterpart of track"""
+        try:
+            async for chunk in chunks:
+                self.arrived()
+                yield chunk
+        except (GeneratorExit, asyncio.CancelledError):
+            self.outcome = "cancelled"
+            raise
+        except Exception:
+            self.outcome = "error"
+            raise
+        finally:
+            await sync_to_async(self.save)()
+
+    def arrived(self):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+
+    def save(self):
+        if self.outcome == "completed" and self.flight is not None and self.flight.failed:
+            self.outcome = "error"
+        LLMCall.objects.create(
+            endpoint=self.endpoint,
+            model=self.model,
+            cache=self.cache,
+            outcome=self.outcome,
+            prompt_chars=self.prompt_chars,
+            ttft_ms=None if self.ttft is None else round(self.ttft * 1000),
+            duration_ms=round((time.perf_counter() - self.started) * 1000),
+            output_tokens=self.request.output_tokens if self.request else None,
+        )
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile of `samples`"""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
@@ -1,3 +1,1339 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+import threading
+from concurrent.futures import Future
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import anthropic
+import httpx
+import numpy as np
+from asgiref.sync import sync_to_async
+
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from exercise import analytics, export, response_cache, singleflight, speculation
+from exercise.bulk import HISTORY_COLUMNS
+from exercise import stats as exercise_stats
+from exercise.coach import astream_completion, build_trainer_summary_prompt, stream_completion
+from exercise.llm import STUB_REPLY, AnthropicBackend, CompletionRequest, StubBackend, get_backend
+from exercise.management.commands.backfill_trainer_summaries import Command as BackfillCommand, RateLimiter
+from exercise.history import latest_workout_exercises, load_category_comparison, recent_history
+from exercise.models import (
+    CachedResponse,
+    Exercise,
+    ExerciseStats,
+    LLMCall,
+    Set,
+    TrainerSummary,
+    Workout,
+    WorkoutExercise,
+)
+from exercise.views import (
+    SUPERSETS,
+    get_exercise_summary,
+    get_step_plan,
+    get_step_urls,
+    save_category,
+    sse_event,
+)
+
+
+def make_history(exercises, workout_count, start=date(2024, 1, 1)):
+    """Create completed workouts that each include every exercise with a couple of sets"""
+    for day in range(workout_count):
+        workout = Workout.objects.create(date=start + timedelta(days=day), completed=True)
+        for order, exercise in enumerate(exercises, start=1):
+            wo = WorkoutExercise.objects.create(workout=workout, exercise=exercise, order=order)
+            Set.objects.bulk_create(
+                Set(exercise=wo, set_num=set_num, reps_or_secs=5 + day, pounds=100 + set_num) for set_num in (1, 2)
+            )
+
+
+class ChooseNextCategoryTests(TestCase):
+    def count_queries(self, exercise_count):
+        exercises = [Exercise.objects.create(name=f"Lift {i}", category="MAIN") for i in range(exercise_count)]
+        make_history(exercises, 3)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("choose_next_category", args=("MAIN",)))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_latest_set_and_date(self):
+        _, response = self.count_queries(2)
+        rows = response.context["exercises"]
+        self.assertEqual([row["latest_date"] for row in rows], [date(2024, 1, 3)] * 2)
+        self.assertEqual(rows[0]["set"], "7 reps x 102 lbs")
+
+    def test_query_count_independent_of_exercise_count(self):
+        few, _ = self.count_queries(2)
+        many, _ = self.count_queries(20)
+        self.assertEqual(few, many)
+
+
+class ExerciseSummaryTests(TestCase):
+    def setUp(self):
+        self.exercises = [Exercise.objects.create(name=f"Lift {i}", category="MAIN") for i in range(3)]
+        self.today = Workout.objects.create(completed=False)
+        self.current = [
+            WorkoutExercise.objects.create(workout=self.today, exercise=exercise, order=order)
+            for order, exercise in enumerate(self.exercises, start=1)
+        ]
+
+    def test_only_recent_workouts_are_shown(self):
+        make_history(self.exercises, 5)
+        Set.objects.create(exercise=self.current[0], set_num=1, reps_or_secs=8, pounds=120)
+        lines = get_exercise_summary(self.current[0].pk)
+        lift_0 = lines[lines.index("* Lift 0 *") + 1 : lines.index("* Lift 1 *") - 1]
+        self.assertEqual(len(lift_0), 5)
+        self.assertIn("Set 1: 9 reps x 101 lbs; Set 2: 9 reps x 102 lbs", lift_0[0])
+        self.assertIn("Set 1: 8 reps", lift_0[1])
+        self.assertEqual(
+            lift_0[2:4],
+            [
+                "Long-term: 5 sessions since 2024-01-01; best e1RM 133 lbs on 2024-01-05, latest 133 lbs; "
+                "last tonnage 1827 lbs (4-session avg 1320)",
+                "Rep PRs at last weights: 101 lbs x 9 (2024-01-05); 102 lbs x 9 (2024-01-05)",
+            ],
+        )
+        self.assertEqual(lift_0[4], "Today: Set 1: 8 reps x 120 lbs")
+        self.assertEqual(
+            len(get_exercise_summary(self.current[0].pk, history_depth=4)), len(lines) + 2 * len(self.exercises)
+        )
+
+    def test_query_count_independent_of_history_length(self):
+        # make_history skips finish_workout, which keeps the stats rows current
+        make_history(self.exercises, 2)
+        exercise_stats.refresh([exercise.pk for exercise in self.exercises])
+        cache.clear()
+        with CaptureQueriesContext(connection) as short:
+            get_exercise_summary(self.current[0].pk)
+        make_history(self.exercises, 20, start=date(2023, 1, 1))
+        exercise_stats.refresh([exercise.pk for exercise in self.exercises])
+        cache.clear()
+        with CaptureQueriesContext(connection) as long:
+            get_exercise_summary(self.current[0].pk)
+        self.assertEqual(len(short.captured_queries), len(long.captured_queries))
+
+
+class SummarizeCategoryTests(TestCase):
+    def summarize(self, exercise_count):
+        exercises = [Exercise.objects.create(name=f"Lift {i}", category="MAIN") for i in range(exercise_count)]
+        make_history(exercises, 3)
+        workout = Workout.objects.filter(exercises__exercise=exercises[0]).latest("date")
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("summarize_category_past", args=("MAIN", workout.pk)))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_compares_with_workout_before(self):
+        _, response = self.summarize(2)
+        data = response.context["exercises"]
+        self.assertEqual(data[0]["last_workout"].date, date(2024, 1, 2))
+        self.assertEqual([s.render() for s in data[0]["current_sets"]], ["7 reps x 101 lbs", "7 reps x 102 lbs"])
+        self.assertEqual([s.render() for s in data[0]["last_sets"]], ["6 reps x 101 lbs", "6 reps x 102 lbs"])
+
+    def test_query_count_independent_of_exercise_count(self):
+        few, _ = self.summarize(2)
+        many, _ = self.summarize(12)
+        self.assertEqual(few, many)
+
+
+class TrainerSummaryPromptTests(TestCase):
+    def test_prompt_construction_does_no_queries(self):
+        exercises = [Exercise.objects.create(name=f"Lift {i}", category="MAIN") for i in range(3)]
+        make_history(exercises, 2)
+        Set.objects.update(duration_secs=75)
+        workout = Workout.objects.latest("date")
+        category_data = load_category_comparison(workout, "MAIN")
+
+        with self.assertNumQueries(0):
+            prompt = build_trainer_summary_prompt(category_data)
+
+        self.assertIn("## Lift 0", prompt)
+        self.assertIn("Set 2: 6 reps x 102 lbs (01:15) (completed in 01:15)", prompt)
+        self.assertIn("Date: 2024-01-01", prompt)
+
+
+class WorkoutSummaryTests(TestCase):
+    def summarize(self, workout):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("workout_summary", args=(workout.pk,)))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_navigation(self):
+        make_history([Exercise.objects.create(name="Lift", category="MAIN")], 3)
+        first, middle, last = Workout.objects.order_by("date")
+        active = Workout.objects.create(completed=False)
+
+        _, response = self.summarize(middle)
+        self.assertEqual(
+            (response.context["prev_workout_id"], response.context["next_workout_id"]), (first.pk, last.pk)
+        )
+        _, response = self.summarize(last)
+        self.assertEqual(response.context["next_workout_id"], active.pk)
+        _, response = self.summarize(active)
+        self.assertEqual((response.context["prev_workout_id"], response.context["next_workout_id"]), (last.pk, None))
+
+    def test_query_count_independent_of_exercise_count(self):
+        counts = []
+        for exercise_count in (5, 50):
+            exercises = [
+                Exercise.objects.create(name=f"Lift {i}", category=Exercise.CATEGORIES[i % 4][0])
+                for i in range(exercise_count)
+            ]
+            make_history(exercises, 1, start=date(2024, 1, 1) + timedelta(days=exercise_count))
+            count, response = self.summarize(Workout.objects.latest("date"))
+            counts.append(count)
+        self.assertEqual(len(response.context["supersets"][0]["exercises"]), 13)
+        self.assertEqual(
+            response.context["supersets"][1]["exercises"][0]["sets"], ["5 reps x 101 lbs", "5 reps x 102 lbs"]
+        )
+        self.assertEqual(counts[0], counts[1])
+
+
+class StepPlanTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.exercises = [Exercise.objects.create(name=f"Lift {i}", category="MAIN") for i in range(2)]
+        save_category("MAIN", [exercise.pk for exercise in self.exercises])
+        self.workout = Workout.objects.get(completed=False)
+
+    def test_plan_is_cached_and_follows_changes(self):
+        first_set = reverse("workout_set", args=(1, self.workout.exercises.get(order=1).pk))
+        get_step_plan(self.workout.pk)
+        with self.assertNumQueries(1):
+            urls = get_step_urls(first_set, self.workout.pk)
+        self.assertEqual(urls["next_url"], reverse("workout_step", args=(self.workout.pk, 6)))
+
+        save_category("MAIN", [self.exercises[1].pk])
+        plan = get_step_plan(self.workout.pk)
+        self.assertNotIn(first_set, plan["steps"])
+        self.assertEqual(len(plan["urls"]), 3 * len(Exercise.CATEGORIES) + 4 + 1)
+
+    def test_plan_cached_before_a_change_elsewhere_is_not_used(self):
+        get_step_plan(self.workout.pk)
+        planks = [Exercise.objects.create(name=f"Plank {i}", category="CORE") for i in range(2)]
+        # Another process, with its own cache, saves the CORE block
+        with mock.patch("exercise.views.cache", LocMemCache("other-process", {})):
+            save_category("CORE", [exercise.pk for exercise in planks])
+
+        urls = get_step_urls(reverse("summarize_category", args=("CORE",)), self.workout.pk)
+        last_plank = self.workout.exercises.get(exercise__category="CORE", order=2)
+        self.assertRedirects(
+            self.client.get(urls["prev_url"]),
+            reverse("workout_set", args=(SUPERSETS["CORE"], last_plank.pk)),
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(self.client.get(reverse("superset_bundle", args=("CORE",))).status_code, 200)
+
+    def test_workout_step_redirects(self):
+        response = self.client.get(reverse("workout_step", args=(self.workout.pk, 1)))
+        self.assertRedirects(response, reverse("preview_category", args=("COND",)), fetch_redirect_response=False)
+
+
+def fake_backend(chunks):
+    return mock.Mock(stream=mock.Mock(side_effect=lambda request: iter(chunks)))
+
+
+class ResponseCacheTests(TestCase):
+    def test_repeat_request_is_served_from_cache(self):
+        backend = fake_backend(["Nice ", "work"])
+        with mock.patch("exercise.coach.get_backend", return_value=backend):
+            self.assertEqual(list(stream_completion("system", "prompt", 10, "test")), ["Nice ", "work"])
+            self.assertEqual(list(stream_completion("system", "prompt", 10, "test")), ["Nice work"])
+            list(stream_completion("system", "other prompt", 10, "test"))
+        self.assertEqual(backend.stream.call_count, 2)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        with mock.patch.object(response_cache, "RESPONSE_CACHE_MAX_ENTRIES", 2):
+            response_cache.store("a", "model", "A")
+            response_cache.store("b", "model", "B")
+            response_cache.get("a")
+            response_cache.store("c", "model", "C")
+        self.assertEqual(set(CachedResponse.objects.values_list("key", flat=True)), {"a", "c"})
+
+    def test_expired_entries_are_ignored(self):
+        response_cache.store("a", "model", "A")
+        CachedResponse.objects.update(created=CachedResponse.objects.get().created - response_cache.RESPONSE_CACHE_TTL)
+        self.assertIsNone(response_cache.get("a"))
+
+
+def run_inline(module):
+    """Patch module's background executor so submitted work runs immediately"""
+
+    def submit(fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    return mock.patch(f"{module}.get_executor", return_value=mock.Mock(submit=submit))
+
+
+@override_settings(COACH_SPECULATION=True)
+class SpeculationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        exercises = [Exercise.objects.create(name=f"Lift {i}", category="MAIN") for i in range(2)]
+        save_category("MAIN", [exercise.pk for exercise in exercises])
+        self.workout = Workout.objects.get(completed=False)
+        self.first, self.second = self.workout.exercises.order_by("order")
+        speculation._stats.clear()
+
+    def log_first_set(self):
+        set_url = reverse("workout_set", args=(1, self.first.pk))
+        next_url = get_step_urls(set_url, self.workout.pk)["next_url"]
+        post = {"reps_or_secs": "5", "pounds": "100", "note": "", "duration_secs": "30", "next_url": next_url}
+        self.client.post(set_url, post)
+
+    def coach_text(self, exercise):
+        response = self.client.get(reverse("coach_stream", args=(exercise.pk,)))
+        return b"".join(response.streaming_content).decode()
+
+    def test_next_set_page_attaches_to_speculation(self):
+        backend = fake_backend(["Add ", "five"])
+        with run_inline("exercise.speculation"), mock.patch("exercise.coach.get_backend", return_value=backend):
+            self.log_first_set()
+            self.assertEqual(self.coach_text(self.second), "data: Add five\n\n")
+        self.assertEqual(backend.stream.call_count, 1)
+        self.assertEqual(speculation.get_stats()["hits"], 1)
+
+    def test_summary_is_built_off_the_request(self):
+        with (
+            mock.patch("exercise.speculation.get_executor") as executor,
+            mock.patch("exercise.views.get_exercise_summary") as summarize,
+        ):
+            self.log_first_set()
+        summarize.assert_not_called()
+        (run,) = executor.return_value.submit.call_args.args
+        self.assertEqual(run.__self__.exercise_pk, self.second.pk)
+
+    def test_changed_summary_is_a_miss(self):
+        backend = fake_backend(["Add ", "five"])
+        with run_inline("exercise.speculation"), mock.patch("exercise.coach.get_backend", return_value=backend):
+            self.log_first_set()
+            Set.objects.create(exercise=self.first, set_num=2, reps_or_secs=5)
+            self.coach_text(self.second)
+        self.assertEqual(backend.stream.call_count, 2)
+        self.assertEqual(speculation.get_stats()["misses"], 1)
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        no_cache = mock.patch.multiple(response_cache, get=mock.Mock(return_value=None), store=mock.Mock())
+        no_cache.start()
+        self.addCleanup(no_cache.stop)
+        # The leader streams from another thread, which can't write to the test database
+        no_telemetry = mock.patch("exercise.telemetry.Call.save")
+        no_telemetry.start()
+        self.addCleanup(no_telemetry.stop)
+
+    def test_late_joiner_gets_earlier_and_live_text(self):
+        first_sent, release = threading.Event(), threading.Event()
+
+        def stream(request):
+            yield "one "
+            first_sent.set()
+            release.wait(5)
+            yield "two"
+
+        backend = mock.Mock(stream=mock.Mock(side_effect=stream))
+        with mock.patch("exercise.coach.get_backend", return_value=backend):
+            leader = []
+            thread = threading.Thread(target=lambda: leader.extend(stream_completion("system", "prompt", 10, "test")))
+            thread.start()
+            first_sent.wait(5)
+            follower = stream_completion("system", "prompt", 10, "test")
+            self.assertEqual(next(follower), "one ")
+            release.set()
+            self.assertEqual(list(follower), ["two"])
+            thread.join(5)
+        self.assertEqual(leader, ["one ", "two"])
+        self.assertEqual(backend.stream.call_count, 1)
+        self.assertEqual(singleflight.get_stats()["in_flight"], 0)
+
+    def test_leader_stops_draining_once_its_followers_leave(self):
+        pulled, follower_left = [], threading.Event()
+
+        def stream(request):
+            for text in ("one ", "two ", "three"):
+                pulled.append(text)
+                yield text
+                follower_left.wait(5)
+
+        backend = mock.Mock(stream=mock.Mock(side_effect=stream))
+        with mock.patch("exercise.coach.get_backend", return_value=backend):
+            leader = stream_completion("system", "prompt", 10, "test")
+            self.assertEqual(next(leader), "one ")
+            follower = stream_completion("system", "prompt", 10, "test")
+            self.assertEqual(next(follower), "one ")
+            # The leader's client disconnects first, so closing it keeps draining for the follower
+            thread = threading.Thread(target=leader.close)
+            thread.start()
+            follower.close()
+            follower_left.set()
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(pulled, ["one ", "two "])
+        self.assertEqual(singleflight.get_stats()["in_flight"], 0)
+
+    async def test_concurrent_async_requests_share_one_stream(self):
+        async def astream(request):
+            for text in ("one ", "two"):
+                await asyncio.sleep(0.01)
+                yield text
+
+        backend = mock.Mock(astream=mock.Mock(side_effect=astream))
+
+        async def collect():
+            return "".join([text async for text in astream_completion("system", "prompt", 10, "test")])
+
+        with mock.patch("exercise.coach.get_backend", return_value=backend):
+            self.assertEqual(await asyncio.gather(collect(), collect(), collect()), ["one two"] * 3)
+        self.assertEqual(backend.astream.call_count, 1)
+
+
+class BackendTests(TestCase):
+    @mock.patch.dict("os.environ", {"ANTHROPIC_API_KEY": "test"})
+    def test_anthropic_client_is_shared_until_fork(self):
+        backend = AnthropicBackend()
+        client = backend.get_client()
+        self.assertIs(client, backend.get_client())
+        with mock.patch("exercise.llm.os.getpid", return_value=-1):
+            forked = backend.get_client()
+        self.assertIsNot(forked, client)
+
+    @override_settings(COACH_LLM_BACKEND="exercise.llm.StubBackend")
+    def test_backend_is_configurable(self):
+        backend = get_backend()
+        self.assertIsInstance(backend, StubBackend)
+        self.assertIs(backend, get_backend())
+        request = CompletionRequest("model", "system", "prompt", 10)
+        self.assertTrue("".join(backend.stream(request)).startswith("Solid work"))
+        self.assertGreater(request.output_tokens, 0)
+
+
+@override_settings(ROOT_URLCONF="asgi_urls", COACH_LLM_BACKEND="exercise.llm.StubBackend")
+class AsyncStreamTests(TestCase):
+    def setUp(self):
+        exercises = [Exercise.objects.create(name=f"Lift {i}", category="MAIN") for i in range(2)]
+        make_history(exercises, 2)
+        save_category("MAIN", [exercise.pk for exercise in exercises])
+        self.current = Workout.objects.get(completed=False).exercises.first()
+
+    async def stream(self, url):
+        self.assertTrue(resolve(url).func.__name__.endswith("_async"))
+        response = await self.async_client.get(url)
+        return "".join([chunk.decode() async for chunk in response.streaming_content])
+
+    async def test_coach_stream(self):
+        text = await self.stream(reverse("coach_stream", args=(self.current.pk,)))
+        self.assertTrue(text.startswith("data: Solid"))
+        self.assertEqual(await CachedResponse.objects.acount(), 1)
+        self.assertEqual(await self.stream(reverse("coach_stream", args=(self.current.pk,))), sse_event(STUB_REPLY))
+
+    async def test_trainer_summary_stream(self):
+        workout = await sync_to_async(Workout.objects.filter(completed=True).latest)("date")
+        text = await self.stream(reverse("trainer_summary_stream_past", args=("MAIN", workout.pk)))
+        self.assertIn("Solid", text)
+        text = await self.stream(reverse("trainer_summary_stream", args=("CORE",)))
+        self.assertEqual(text, "data: No exercises found for category CORE\n\n")
+
+
+class TrainerSummaryStorageTests(TestCase):
+    def setUp(self):
+        self.exercises = [Exercise.objects.create(name=f"Lift {i}", category="MAIN") for i in range(2)]
+        make_history(self.exercises, 1)
+        save_category("MAIN", [exercise.pk for exercise in self.exercises])
+        self.workout = Workout.objects.get(completed=False)
+        for exercise in self.workout.exercises.all():
+            Set.objects.create(exercise=exercise, set_num=1, reps_or_secs=8, pounds=110)
+        self.backend = fake_backend(["Strong ", "day"])
+        backend = mock.patch("exercise.coach.get_backend", return_value=self.backend)
+        backend.start()
+        self.addCleanup(backend.stop)
+        no_cache = mock.patch.multiple(response_cache, get=mock.Mock(return_value=None), store=mock.Mock())
+        no_cache.start()
+        self.addCleanup(no_cache.stop)
+
+    def summary_text(self):
+        response = self.client.get(reverse("trainer_summary_stream_past", args=("MAIN", self.workout.pk)))
+        return b"".join(response.streaming_content).decode()
+
+    def test_finishing_a_workout_stores_summaries(self):
+        with run_inline("exercise.trainer_summaries"):
+            self.client.get(reverse("finish_workout", args=(self.workout.pk,)))
+        self.assertEqual(list(TrainerSummary.objects.values_list("category", "text")), [("MAIN", "Strong day")])
+        self.assertEqual(self.summary_text(), "data: Strong day\n\n")
+        self.assertEqual(self.backend.stream.call_count, 1)
+
+    def test_summary_is_regenerated_when_sets_change(self):
+        self.workout.completed = True
+        self.workout.date = date(2024, 2, 1)
+        self.workout.save()
+        self.summary_text()
+        self.summary_text()
+        self.assertEqual(self.backend.stream.call_count, 1)
+        Set.objects.filter(exercise__workout=self.workout).update(pounds=115)
+        self.summary_text()
+        self.assertEqual(self.backend.stream.call_count, 2)
+        self.assertEqual(TrainerSummary.objects.count(), 1)
+
+
+class InlineExecutor:
+    """Stands in for ThreadPoolExecutor, running each job as it's submitted"""
+
+    def __init__(self, max_workers):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class BackfillTrainerSummariesTests(TestCase):
+    def setUp(self):
+        make_history([Exercise.objects.create(name="Squat", category="MAIN")], 2)
+        make_history([Exercise.objects.create(name="Plank", category="CORE")], 1, start=date(2024, 1, 5))
+        self.first, self.second, self.third = Workout.objects.order_by("date")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = Path(directory.name) / "checkpoint"
+        command = "exercise.management.commands.backfill_trainer_summaries"
+        for patch in (
+            mock.patch(f"{command}.ThreadPoolExecutor", InlineExecutor),
+            # summarize normally runs on a worker thread that closes its own connection
+            mock.patch("exercise.background.connections"),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.backend = fake_backend(["Solid ", "work"])
+        self.use_backend = mock.patch(f"{command}.get_backend", return_value=self.backend)
+        self.use_backend.start()
+        self.addCleanup(self.use_backend.stop)
+
+    def backfill(self, **options):
+        out, err = StringIO(), StringIO()
+        call_command(
+            "backfill_trainer_summaries",
+            checkpoint=self.checkpoint,
+            rate=60000,
+            backoff=0,
+            stdout=out,
+            stderr=err,
+            **options,
+        )
+        return out.getvalue().splitlines(), err.getvalue()
+
+    def checkpointed(self):
+        return [tuple(json.loads(line)) for line in self.checkpoint.read_text().splitlines()]
+
+    def test_skips_stored_summaries_and_resumes_from_the_checkpoint(self):
+        TrainerSummary.objects.create(workout=self.first, category="MAIN", prompt_hash="", model="", text="Stored")
+        self.checkpoint.write_text(json.dumps([self.second.pk, "MAIN"]) + "\n")
+        out, _ = self.backfill()
+        self.assertEqual(out[0], f"{3 * len(Exercise.CATEGORIES) - 2} summaries to generate, 2 already done")
+        self.assertEqual(out[-1], "Generated 1 summaries (0 tokens), 0 failed")
+        self.assertEqual(
+            list(TrainerSummary.objects.order_by("workout__date").values_list("workout", "category", "text")),
+            [(self.first.pk, "MAIN", "Stored"), (self.third.pk, "CORE", "Solid work")],
+        )
+        self.assertEqual(len(self.checkpointed()), 3 * len(Exercise.CATEGORIES) - 1)
+
+        out, _ = self.backfill()
+        self.assertEqual(out[0], f"0 summaries to generate, {3 * len(Exercise.CATEGORIES)} already done")
+        self.assertEqual(self.backend.stream.call_count, 1)
+
+    def test_api_errors_are_retried(self):
+        error = anthropic.APIError("Overloaded", httpx.Request("POST", "https://api.anthropic.com"), body=None)
+        # The first summary succeeds on its retry; the second runs out of them
+        outcomes = iter([error, "Solid work", error, error, "Solid work"])
+
+        def stream(request):
+            if isinstance(outcome := next(outcomes), Exception):
+                raise outcome
+            yield outcome
+
+        self.backend.stream.side_effect = stream
+        out, err = self.backfill(retries=1)
+        self.assertEqual(out[-1], "Generated 2 summaries (0 tokens), 1 failed")
+        self.assertEqual(err, f"Workout {self.second.pk} MAIN failed: Overloaded\n")
+        self.assertNotIn((self.second.pk, "MAIN"), self.checkpointed())
+        self.assertEqual(LLMCall.objects.filter(outcome="error").count(), 3)
+
+        self.backend.stream.side_effect = lambda request: iter(["Solid work"])
+        out, _ = self.backfill()
+        self.assertEqual(out[0], "1 summaries to generate, 11 already done")
+        self.assertTrue(TrainerSummary.objects.filter(workout=self.second, category="MAIN").exists())
+
+    def test_interrupted_run_reports_where_to_resume(self):
+        def interrupt_after_first(futures):
+            yield next(iter(futures))
+            raise KeyboardInterrupt
+
+        with mock.patch("exercise.management.commands.backfill_trainer_summaries.as_completed", interrupt_after_first):
+            out, err = self.backfill()
+        self.assertEqual(err, "Interrupted; finishing the summaries under way\n")
+        self.assertEqual(
+            out[-1], f"Generated 0 summaries (0 tokens), 0 failed; interrupted, rerun to resume from {self.checkpoint}"
+        )
+        self.assertEqual(self.checkpointed(), [(self.first.pk, Exercise.CATEGORIES[0][0])])
+
+    def test_invalid_options(self):
+        for options, message in (
+            ({"workers": 0}, "--workers must be at least 1"),
+            ({"rate": 0}, "--rate must be positive"),
+            ({"retries": -1}, "--retries and --backoff can't be negative"),
+        ):
+            with self.subTest(**options), self.assertRaisesMessage(CommandError, message):
+                call_command("backfill_trainer_summaries", checkpoint=self.checkpoint, **options)
+        self.assertFalse(self.checkpoint.exists())
+
+
+class ExerciseStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.exercise = Exercise.objects.create(name="Squat", category="MAIN")
+        make_history([self.exercise], 2)
+        save_category("MAIN", [self.exercise.pk])
+        self.workout = Workout.objects.get(completed=False)
+        self.current = self.workout.exercises.get()
+
+    def log_set(self, set_num, reps, pounds):
+        url = reverse("workout_set", args=(set_num, self.current.pk))
+        post = {"reps_or_secs": str(reps), "pounds": str(pounds), "note": "", "duration_secs": "", "next_url": url}
+        return self.client.post(url, post, follow=True)
+
+    def test_records_are_flagged_when_set_is_saved(self):
+        response = self.log_set(1, 6, 102)
+        self.assertEqual(list(response.context["messages"]), [])
+        response = self.log_set(2, 4, 150)
+        self.assertEqual([str(m) for m in response.context["messages"]], ["Heaviest Squat yet: 150 lbs"])
+        self.assertEqual(ExerciseStats.objects.get().best_pounds, 150)
+
+    def test_finishing_workout_moves_last_workout_pointer(self):
+        self.log_set(1, 8, 110)
+        self.assertEqual(ExerciseStats.objects.get().last_date, date(2024, 1, 2))
+        # Trainer summaries aren't under test; don't start generating them
+        with mock.patch("exercise.trainer_summaries.get_executor"):
+            self.client.get(reverse("finish_workout", args=(self.workout.pk,)))
+        stats = ExerciseStats.objects.get()
+        self.assertEqual(stats.last_workout_exercise, self.current)
+        self.assertEqual(stats.last_sets, ["8 reps x 110 lbs"])
+
+    def test_set_page_reads_last_workout_from_stats(self):
+        self.client.get(reverse("workout_set", args=(1, self.current.pk)))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("workout_set", args=(1, self.current.pk)))
+        self.assertEqual([s.render() for s in response.context["last_sets"]], ["6 reps x 101 lbs", "6 reps x 102 lbs"])
+        self.assertLessEqual(len(ctx.captured_queries), 5)
+
+
+class SyncSetsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.exercise = Exercise.objects.create(name="Squat", category="MAIN")
+        make_history([self.exercise], 2)
+        save_category("MAIN", [self.exercise.pk])
+        self.current = WorkoutExercise.objects.get(workout__completed=False)
+
+    def sync(self, *sets):
+        return self.client.post(reverse("sync_sets"), {"sets": list(sets)}, content_type="application/json")
+
+    def entry(self, key, set_num, reps, pounds):
+        return {"key": key, "exercise": self.current.pk, "set_num": set_num, "reps_or_secs": reps, "pounds": pounds}
+
+    def test_batch_is_saved_with_records(self):
+        response = self.sync(self.entry("a", 1, 6, 102), self.entry("b", 2, 4, 150), self.entry("c", 3, 4, 160))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "saved": ["a", "b", "c"],
+                "duplicates": [],
+                "records": ["Heaviest Squat yet: 150 lbs", "Heaviest Squat yet: 160 lbs"],
+            },
+        )
+        self.assertEqual(
+            [s.render() for s in self.current.sets.order_by("set_num")],
+            ["6 reps x 102 lbs", "4 reps x 150 lbs", "4 reps x 160 lbs"],
+        )
+        self.assertEqual(ExerciseStats.objects.get().best_pounds, 160)
+
+    def test_replayed_batch_is_idempotent(self):
+        self.sync(self.entry("a", 1, 6, 102), self.entry("b", 2, 6, 104))
+        self.sync(self.entry("c", 2, 7, 104))
+        response = self.sync(self.entry("a", 1, 6, 102), self.entry("b", 2, 6, 104), self.entry("d", 3, 5, 104))
+        self.assertEqual(response.json()["saved"], ["d"])
+        self.assertEqual(response.json()["duplicates"], ["a", "b"])
+        self.assertEqual(
+            list(self.current.sets.order_by("set_num").values_list("set_num", "reps_or_secs")),
+            [(1, 6), (2, 7), (3, 5)],
+        )
+
+    def test_editing_a_past_workout_refreshes_its_stats(self):
+        past = WorkoutExercise.objects.filter(workout__completed=True).latest("workout__date")
+        self.sync({"key": "a", "exercise": past.pk, "set_num": 2, "reps_or_secs": 3, "pounds": 200})
+        stats = ExerciseStats.objects.get()
+        self.assertEqual(stats.last_sets, ["6 reps x 101 lbs", "3 reps x 200 lbs"])
+        self.assertEqual(stats.best_pounds, 200)
+
+    def test_later_entry_for_a_set_wins(self):
+        self.sync(self.entry("a", 1, 6, 102), self.entry("b", 1, 8, 102))
+        self.assertEqual(list(self.current.sets.values_list("set_num", "reps_or_secs")), [(1, 8)])
+
+    def test_bad_batch_saves_nothing(self):
+        for entry in (
+            self.entry("a", 0, 6, 102),
+            {**self.entry("a", 1, 6, 102), "exercise": 0},
+            {**self.entry("a", 1, 6, 102), "pounds": -5},
+            {"exercise": self.current.pk, "set_num": 1},
+        ):
+            with self.subTest(entry=entry):
+                response = self.sync(self.entry("ok", 1, 6, 102), entry)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(self.current.sets.exists())
+        self.assertEqual(self.client.get(reverse("sync_sets")).status_code, 405)
+
+
+class SupersetBundleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.exercises = [Exercise.objects.create(name=name, category="CORE") for name in ("Plank", "Crunch")]
+        make_history(self.exercises[:1], 2)
+        exercise_stats.refresh([e.pk for e in self.exercises])
+        save_category("CORE", [e.pk for e in self.exercises])
+        self.workout = Workout.objects.get(completed=False)
+        self.current = list(self.workout.exercises.order_by("order"))
+        Set.objects.create(exercise=self.current[0], set_num=1, reps_or_secs=7, pounds=105)
+
+    def test_bundle_matches_set_pages(self):
+        bundle = self.client.get(reverse("superset_bundle", args=("CORE",))).json()
+        self.assertEqual(bundle["set_count"], SUPERSETS["CORE"])
+        plank, crunch = bundle["exercises"]
+        self.assertEqual(plank["today_sets"][0]["text"], "7 reps x 105 lbs")
+        self.assertEqual(plank["last_workout"], "2024-01-02")
+        self.assertEqual([s["text"] for s in plank["last_sets"]], ["6 reps x 101 lbs", "6 reps x 102 lbs"])
+        self.assertEqual((crunch["today_sets"], crunch["last_workout"], crunch["last_sets"]), ([], None, []))
+
+        # Each step leads to the set page the server-rendered flow would show there
+        for step in bundle["steps"]:
+            page = self.client.get(step["url"], follow=True)
+            self.assertEqual(page.context["set_num"], step["set_num"])
+            self.assertEqual(page.context["exercise"].pk, step["exercise"])
+        self.assertEqual(
+            [(step["set_num"], step["exercise"]) for step in bundle["steps"]],
+            [(1, self.current[0].pk), (1, self.current[1].pk), (2, self.current[0].pk), (2, self.current[1].pk)],
+        )
+        first = self.client.get(bundle["steps"][0]["url"], follow=True)
+        last = self.client.get(bundle["steps"][-1]["url"], follow=True)
+        self.assertEqual(bundle["prev_url"], first.context["prev_url"])
+        self.assertEqual(bundle["next_url"], last.context["next_url"])
+
+    def test_missing_block(self):
+        self.assertEqual(self.client.get(reverse("superset_bundle", args=("MAIN",))).status_code, 404)
+        self.assertEqual(self.client.get(reverse("superset_bundle", args=("NOPE",))).status_code, 404)
+
+
+@skipUnless(connection.vendor == "postgresql", "query plans are only checked against PostgreSQL")
+class QueryPlanTests(TestCase):
+    """The hot queries should keep using indexes once the history is large"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [category for category, _ in Exercise.CATEGORIES]
+        cls.exercises = Exercise.objects.bulk_create(
+            Exercise(name=f"Lift {i}", category=categories[i % len(categories)]) for i in range(40)
+        )
+        start = date(2015, 1, 1)
+        workouts = Workout.objects.bulk_create(
+            Workout(date=start + timedelta(days=day), completed=True) for day in range(3000)
+        )
+        workouts.append(Workout.objects.create(completed=False))
+        workout_exercises = WorkoutExercise.objects.bulk_create(
+            WorkoutExercise(workout=workout, exercise=cls.exercises[(day * 4 + order) % 40], order=order)
+            for day, workout in enumerate(workouts)
+            for order in range(4)
+        )
+        Set.objects.bulk_create(
+            Set(exercise=wo, set_num=set_num, reps_or_secs=8, pounds=100)
+            for wo in workout_exercises
+            for set_num in (1, 2)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndexes(self, run, *tables, index=None):
+        """Run `run`, then EXPLAIN each query it made
+
+        Checks that none of the queries sequentially scans `tables`, and that
+        at least one of them uses `index` if given.
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            run()
+        self.assertTrue(ctx.captured_queries)
+        plans = []
+        for query in ctx.captured_queries:
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN " + query["sql"])
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+            for table in tables:
+                self.assertNotIn(f"Seq Scan on {table} ", plan, plan)
+            plans.append(plan)
+        if index:
+            self.assertIn(index, "\n\n".join(plans))
+
+    def test_latest_completed_workout(self):
+        self.assertUsesIndexes(
+            lambda: Workout.objects.filter(completed=True).order_by("-date").first(),
+            "exercise_workout",
+            index="workout_date_idx",
+        )
+
+    def test_category_summary_neighbors(self):
+        # The previous and next workouts with the category, by date
+        workout = Workout.objects.filter(completed=True).order_by("date")[1500]
+        self.assertUsesIndexes(
+            lambda: self.client.get(reverse("summarize_category_past", args=("MAIN", workout.pk))),
+            "exercise_workout",
+            "exercise_workoutexercise",
+            index="workout_date_idx",
+        )
+
+    def test_workout_summary_neighbors(self):
+        # with_neighbor_workouts' subqueries, for a dated and the undated workout
+        for workout in (
+            Workout.objects.filter(completed=True).order_by("date")[1500],
+            Workout.objects.get(completed=False),
+        ):
+            self.assertUsesIndexes(
+                lambda: self.client.get(reverse("workout_summary", args=(workout.pk,))),
+                "exercise_workout",
+                index="workout_date_idx",
+            )
+
+    def test_latest_workout_exercises(self):
+        exercise = self.exercises[0]
+        self.assertUsesIndexes(lambda: latest_workout_exercises([exercise.pk]), "exercise_workoutexercise")
+        self.assertUsesIndexes(
+            lambda: latest_workout_exercises([exercise.pk], before=date(2018, 1, 1)), "exercise_workoutexercise"
+        )
+
+    def test_recent_history(self):
+        exercise = self.exercises[0]
+        self.assertUsesIndexes(lambda: recent_history([exercise.pk], 2), "exercise_workoutexercise")
+
+
+HISTORY_SIZES = (10, 100, 1000)
+
+
+@override_settings(COACH_LLM_BACKEND="exercise.llm.StubBackend", COACH_SPECULATION=False)
+class QueryBudgetTests(TestCase):
+    """Every page makes a fixed number of queries, however long the workout history is"""
+
+    # Most queries each request may make
+    BUDGETS = {
+        "choose_next_category": 2,
+        "next_category": 2,
+        "workout_set": 6,
+        "workout_set_post": 5,
+        "sync_sets": 9,
+        "superset_bundle": 7,
+        "exercise_progress": 2,
+        "summarize_category": 7,
+        "summarize_category_past": 7,
+        "workout_summary": 3,
+        "get_exercise_summary": 7,
+        "coach_stream": 17,
+        "trainer_summary_stream": 15,
+    }
+
+    def setUp(self):
+        self.exercises = [
+            Exercise.objects.create(name=f"{category} {i}", category=category)
+            for category, _ in Exercise.CATEGORIES
+            for i in range(2)
+        ]
+        self.next_date = date(2020, 1, 1)
+        self.synced = 0
+        self.active = Workout.objects.create(completed=False)
+        self.current = []
+        for order, exercise in enumerate(self.exercises, start=1):
+            wo = WorkoutExercise.objects.create(workout=self.active, exercise=exercise, order=order)
+            Set.objects.create(exercise=wo, set_num=1, reps_or_secs=8, pounds=100)
+            self.current.append(wo)
+
+    def extend_history(self, workout_count):
+        """Add completed workouts of every exercise until there are `workout_count` in total"""
+        existing = Workout.objects.filter(completed=True).count()
+        workouts = Workout.objects.bulk_create(
+            Workout(date=self.next_date + timedelta(days=day), completed=True)
+            for day in range(workout_count - existing)
+        )
+        self.next_date += timedelta(days=len(workouts))
+        workout_exercises = WorkoutExercise.objects.bulk_create(
+            WorkoutExercise(workout=workout, exercise=exercise, order=order)
+            for workout in workouts
+            for order, exercise in enumerate(self.exercises, start=1)
+        )
+        Set.objects.bulk_create(
+            Set(exercise=wo, set_num=set_num, reps_or_secs=8, pounds=90 + set_num)
+            for wo in workout_exercises
+            for set_num in (1, 2)
+        )
+        exercise_stats.refresh([exercise.pk for exercise in self.exercises])
+
+    def requests(self):
+        """Map each budget name to a callable making that request"""
+        wo = self.current[0]
+        past = Workout.objects.filter(completed=True).latest("date")
+        category = wo.exercise.category
+        set_page = reverse("workout_set", args=(2, wo.pk))
+
+        def stream(url):
+            response = self.client.get(url)
+            b"".join(response.streaming_content)
+            return response
+
+        def post_set():
+            response = self.client.post(
+                set_page,
+                {"reps_or_secs": "9", "pounds": "100", "note": "", "duration_secs": "", "next_url": set_page},
+            )
+            wo.sets.filter(set_num=2).delete()
+            return response
+
+        def sync_sets():
+            self.synced += 1
+            batch = [
+                {
+                    "key": f"{self.synced}-{other.pk}",
+                    "exercise": other.pk,
+                    "set_num": 2,
+                    "reps_or_secs": 9,
+                    "pounds": 100,
+                }
+                for other in self.current[:2]
+            ]
+            response = self.client.post(reverse("sync_sets"), {"sets": batch}, content_type="application/json")
+            Set.objects.filter(exercise__in=self.current[:2], set_num=2).delete()
+            return response
+
+        return {
+            "choose_next_category": lambda: self.client.get(reverse("choose_next_category", args=(category,))),
+            "next_category": lambda: self.client.get(reverse("next_category", args=(category,))),
+            "workout_set": lambda: self.client.get(set_page),
+            "workout_set_post": post_set,
+            "sync_sets": sync_sets,
+            "superset_bundle": lambda: self.client.get(reverse("superset_bundle", args=(category,))),
+            "exercise_progress": lambda: self.client.get(reverse("exercise_progress", args=(wo.exercise_id,))),
+            "summarize_category": lambda: self.client.get(reverse("summarize_category", args=(category,))),
+            "summarize_category_past": lambda: self.client.get(
+                reverse("summarize_category_past", args=(category, past.pk))
+            ),
+            "workout_summary": lambda: self.client.get(reverse("workout_summary", args=(past.pk,))),
+            "get_exercise_summary": lambda: get_exercise_summary(wo.pk),
+            "coach_stream": lambda: stream(reverse("coach_stream", args=(wo.pk,))),
+            "trainer_summary_stream": lambda: stream(reverse("trainer_summary_stream", args=(category,))),
+        }
+
+    def count_queries(self):
+        counts = {}
+        for name, make_request in self.requests().items():
+            # Start every request cold, so cached plans and replies don't hide queries
+            cache.clear()
+            CachedResponse.objects.all().delete()
+            with CaptureQueriesContext(connection) as ctx:
+                response = make_request()
+            if hasattr(response, "status_code"):
+                self.assertLess(response.status_code, 400, name)
+            counts[name] = len(ctx.captured_queries)
+        return counts
+
+    def test_budgets(self):
+        counts = {}
+        for size in HISTORY_SIZES:
+            self.extend_history(size)
+            counts[size] = self.count_queries()
+        for name, budget in self.BUDGETS.items():
+            with self.subTest(view=name):
+                per_size = [counts[size][name] for size in HISTORY_SIZES]
+                self.assertLessEqual(max(per_size), budget, f"queries per history size: {per_size}")
+                self.assertEqual(len(set(per_size)), 1, f"queries grew with history: {per_size}")
+
+
+class GenerateHistoryTests(TestCase):
+    def generate(self, seed):
+        call_command("generate_history", years=0.1, exercises_per_category=3, seed=seed, stdout=StringIO())
+        return list(Set.objects.order_by("pk").values_list("set_num", "reps_or_secs", "pounds", "duration_secs"))
+
+    def test_sets_follow_supersets(self):
+        self.generate(seed=1)
+        workout = Workout.objects.filter(completed=True).first()
+        for wo in workout.exercises.select_related("exercise"):
+            self.assertEqual(wo.sets.count(), SUPERSETS[wo.exercise.category])
+        self.assertEqual(workout.exercises.count(), 2 * len(Exercise.CATEGORIES))
+        self.assertEqual(ExerciseStats.objects.count(), 3 * len(Exercise.CATEGORIES))
+
+    def test_seeded_runs_repeat(self):
+        first = self.generate(seed=1)
+        Workout.objects.all().delete()
+        self.assertEqual(self.generate(seed=1), first)
+
+
+class BenchmarkViewsTests(TestCase):
+    def setUp(self):
+        call_command("generate_history", years=0.1, exercises_per_category=2, stdout=StringIO())
+
+    def test_report_and_compare(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / "baseline.json"
+            call_command("benchmark_views", iterations=2, output=output, stdout=StringIO())
+            report = json.loads(output.read_text())
+            self.assertEqual(set(report["results"]), set(QueryBudgetTests.BUDGETS) - {"get_exercise_summary"})
+            self.assertTrue(all(result["queries"] for result in report["results"].values()))
+            self.assertFalse(Workout.objects.filter(completed=False).exists())
+
+            for result in report["results"].values():
+                result["queries"] -= 1
+            output.write_text(json.dumps(report))
+            with self.assertRaisesMessage(CommandError, f"{len(report['results'])} regressions"):
+                call_command("benchmark_views", iterations=2, compare=output, threshold=1000, stdout=StringIO())
+
+
+@override_settings(COACH_LLM_BACKEND="exercise.llm.StubBackend", SERVER_TIMING_LOG=True)
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        exercises = [Exercise.objects.create(name=f"Lift {i}", category="MAIN") for i in range(2)]
+        make_history(exercises, 2)
+        save_category("MAIN", [exercise.pk for exercise in exercises])
+        self.current = Workout.objects.get(completed=False).exercises.first()
+
+    def metrics(self, response):
+        return dict(metric.split(";", 1) for metric in response["Server-Timing"].split(", "))
+
+    def test_page_header(self):
+        with CaptureQueriesContext(connection) as ctx, self.assertLogs("exercise.timing") as logs:
+            response = self.client.get(reverse("workout_set", args=(1, self.current.pk)))
+        metrics = self.metrics(response)
+        self.assertEqual(set(metrics), {"sql", "template", "view"})
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', metrics["sql"])
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line["sql_count"], len(ctx.captured_queries))
+        self.assertEqual(line["path"], response.wsgi_request.path)
+
+    def test_stream_logs_time_to_first_token(self):
+        with self.assertLogs("exercise.timing") as logs:
+            response = self.client.get(reverse("coach_stream", args=(self.current.pk,)))
+            self.assertEqual(set(self.metrics(response)), {"view"})
+            self.assertEqual(logs.records, [])
+            b"".join(response.streaming_content)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertGreater(line["sql_count"], 0)
+        self.assertIn("llm_ttft_ms", line)
+        self.assertGreaterEqual(line["stream_ms"], line["llm_ttft_ms"])
+
+    @override_settings(ROOT_URLCONF="asgi_urls")
+    async def test_async_stream_logs_time_to_first_token(self):
+        with self.assertLogs("exercise.timing") as logs:
+            response = await self.async_client.get(reverse("coach_stream", args=(self.current.pk,)))
+            [chunk async for chunk in response.streaming_content]
+        line = json.loads(logs.records[0].getMessage())
+        self.assertGreater(line["sql_count"], 0)
+        self.assertIn("llm_ttft_ms", line)
+
+
+@override_settings(COACH_LLM_BACKEND="exercise.llm.StubBackend")
+class TelemetryTests(TestCase):
+    def test_calls_are_recorded(self):
+        self.assertEqual("".join(stream_completion("system", "prompt", 10, "coach")), STUB_REPLY)
+        self.assertEqual("".join(stream_completion("system", "prompt", 10, "coach")), STUB_REPLY)
+        cancelled = stream_completion("system", "another prompt", 10, "trainer_summary")
+        next(cancelled)
+        cancelled.close()
+
+        miss, hit, partial = LLMCall.objects.order_by("pk")
+        self.assertEqual((miss.cache, miss.outcome, miss.output_tokens), ("miss", "completed", len(STUB_REPLY.split())))
+        self.assertEqual((miss.endpoint, miss.prompt_chars), ("coach", len("prompt")))
+        self.assertLessEqual(miss.ttft_ms, miss.duration_ms)
+        self.assertEqual((hit.cache, hit.outcome, hit.output_tokens), ("hit", "completed", None))
+        self.assertEqual((partial.endpoint, partial.outcome), ("trainer_summary", "cancelled"))
+
+    def test_errors_are_recorded(self):
+        backend = mock.Mock(stream=mock.Mock(side_effect=RuntimeError("overloaded")))
+        with mock.patch("exercise.coach.get_backend", return_value=backend), self.assertRaises(RuntimeError):
+            list(stream_completion("system", "prompt", 10, "coach"))
+        self.assertEqual(LLMCall.objects.get().outcome, "error")
+
+    async def test_async_calls_are_recorded(self):
+        self.assertEqual(
+            "".join([text async for text in astream_completion("system", "prompt", 10, "coach")]), STUB_REPLY
+        )
+        call = await LLMCall.objects.aget()
+        self.assertEqual((call.cache, call.outcome, call.output_tokens), ("miss", "completed", len(STUB_REPLY.split())))
+
+    @override_settings(COACH_LLM_BACKEND="exercise.llm.StubBackend", COACH_STUB_DELAY=0)
+    def test_backfill_calls_are_recorded(self):
+        exercise = Exercise.objects.create(name="Squat", category="MAIN")
+        make_history([exercise], 1)
+        command = BackfillCommand()
+        command.limiter, command.retries, command.backoff = RateLimiter(6000), 0, 0
+        # summarize normally runs on a worker thread that closes its own connection
+        with mock.patch("exercise.background.connections"):
+            command.summarize(Workout.objects.get().pk, "MAIN")
+        call = LLMCall.objects.get()
+        self.assertEqual((call.endpoint, call.cache, call.outcome), ("trainer_summary_backfill", "miss", "completed"))
+        self.assertEqual(call.output_tokens, len(STUB_REPLY.split()))
+
+    def test_report(self):
+        LLMCall.objects.bulk_create(
+            LLMCall(
+                endpoint="coach",
+                model="model-a",
+                cache="miss",
+                outcome="completed",
+                prompt_chars=1000,
+                ttft_ms=ttft,
+                duration_ms=ttft + 1000,
+                output_tokens=50,
+            )
+            for ttft in range(100, 1100, 10)
+        )
+        LLMCall.objects.create(
+            endpoint="coach", model="model-b", cache="hit", outcome="completed", prompt_chars=1000, duration_ms=1
+        )
+        out = StringIO()
+        call_command("llm_latency_report", stdout=out)
+        report = out.getvalue()
+        self.assertIn("101 LLM calls", report)
+        self.assertRegex(report, r"coach +101 +1% +0 +0 +590/1040/1080 +1590/2040/2080 +50/50/50 +1000")
+        self.assertRegex(report, r"model-b +1 +100% .* - +- +-")
+
+
+class ImportHistoryTests(TestCase):
+    def setUp(self):
+        self.squat = Exercise.objects.create(name="Squat", category="MAIN")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def run_import(self, name, content, **options):
+        path = self.directory / name
+        path.write_text(content)
+        call_command("import_history", str(path), chunk_size=1, stdout=StringIO(), **options)
+
+    def test_csv(self):
+        self.run_import(
+            "history.csv",
+            "date,exercise,set_num,reps_or_secs,pounds,duration_secs,note\n"
+            "2024-01-01,squat,1,5,225,40,\n"
+            "2024-01-01,Squat,2,5,235,45,grindy\n"
+            "2024-01-03,Squat,,5,245,,\n"
+            "2024-01-03,Squat,,4,245,,\n",
+        )
+        workouts = Workout.objects.order_by("date")
+        self.assertEqual([workout.date for workout in workouts], [date(2024, 1, 1), date(2024, 1, 3)])
+        self.assertTrue(all(workout.completed for workout in workouts))
+        last = workouts[1].exercises.get()
+        self.assertEqual(list(last.sets.values_list("set_num", "reps_or_secs")), [(1, 5), (2, 4)])
+        self.assertEqual(Set.objects.get(note="grindy").duration_secs, 45)
+        self.assertEqual(ExerciseStats.objects.get(pk=self.squat.pk).best_pounds, 245)
+
+    def test_workouts_on_the_same_date(self):
+        rows = "date,workout,exercise,set_num,reps_or_secs\n2024-01-01,a,Squat,1,5\n2024-01-01,b,Squat,1,3\n"
+        self.run_import("history.csv", rows)
+        self.assertEqual(
+            list(Set.objects.order_by("exercise__workout").values_list("exercise__workout__date", "reps_or_secs")),
+            [(date(2024, 1, 1), 5), (date(2024, 1, 1), 3)],
+        )
+        Workout.objects.all().delete()
+
+        rows = "date,exercise,set_num,reps_or_secs\n2024-01-01,Squat,1,5\n2024-01-01,Squat,2,5\n2024-01-01,squat,1,3\n"
+        with self.assertRaisesMessage(CommandError, "Line 4: set 1 of this exercise is already in the workout"):
+            self.run_import("history.csv", rows)
+        self.assertFalse(Workout.objects.exists())
+
+    def test_jsonl_creates_exercises(self):
+        rows = [
+            {"date": "2024-02-01", "exercise": "Squat", "order": 2, "reps_or_secs": 5, "pounds": 200},
+            {"date": "2024-02-01", "exercise": "Plank", "category": "CORE", "order": 1, "reps_or_secs": 60},
+        ]
+        with self.assertRaisesMessage(CommandError, "Line 2: unknown exercise 'Plank'"):
+            self.run_import("history.jsonl", "\n".join(json.dumps(row) for row in rows))
+        Workout.objects.all().delete()
+
+        self.run_import("history.jsonl", "\n".join(json.dumps(row) for row in rows), create_exercises=True)
+        workout = Workout.objects.get()
+        self.assertEqual(
+            list(workout.exercises.order_by("order").values_list("exercise__name", "exercise__category")),
+            [("Plank", "CORE"), ("Squat", "MAIN")],
+        )
+
+
+class ExportHistoryTests(TestCase):
+    def setUp(self):
+        self.exercises = [
+            Exercise.objects.create(name="Squat", category="MAIN"),
+            Exercise.objects.create(name="Plank, weighted", category="CORE", is_seconds=True),
+        ]
+        make_history(self.exercises, 3)
+        Workout.objects.create(completed=False)
+
+    def exported(self):
+        """history_sets() with workout pks, which an import doesn't keep, numbered in order of appearance"""
+        numbers = {}
+        return [
+            (day, numbers.setdefault(workout, len(numbers)), *rest) for day, workout, *rest in export.history_sets()
+        ]
+
+    def test_round_trip(self):
+        # A second workout on the last day, as finishing two workouts in a day makes
+        make_history(self.exercises[:1], 1, start=date(2024, 1, 3))
+        for fmt in export.FORMATS:
+            with self.subTest(fmt=fmt):
+                out = StringIO()
+                call_command("export_history", format=fmt, stdout=out)
+                original = self.exported()
+                self.assertEqual(len(original), 14)
+                self.assertEqual(len({values[1] for values in original}), 4)
+                self.assertEqual([values[0] for values in original], sorted(values[0] for values in original))
+
+                Workout.objects.all().delete()
+                with tempfile.NamedTemporaryFile("w", suffix=f".{fmt}") as file:
+                    file.write(out.getvalue())
+                    file.flush()
+                    call_command("import_history", file.name, stdout=StringIO())
+                self.assertEqual(self.exported(), original)
+
+    def test_unknown_output_suffix(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / "history.json"
+            with self.assertRaisesMessage(CommandError, "Can't tell the output format"):
+                call_command("export_history", output=output, stdout=StringIO())
+            self.assertFalse(output.exists())
+            call_command("export_history", output=output, format="jsonl", stdout=StringIO())
+            self.assertEqual(len(output.read_text().splitlines()), 12)
+
+    def test_streaming_download(self):
+        response = self.client.get(reverse("export_history", args=("jsonl",)))
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows[0], {**rows[0], "date": "2024-01-01", "exercise": "Squat", "set_num": 1, "pounds": 101})
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(self.client.get(reverse("export_history", args=("xml",))).status_code, 404)
+
+    @override_settings(ROOT_URLCONF="asgi_urls")
+    async def test_async_download(self):
+        self.assertEqual(resolve(reverse("export_history", args=("csv",))).func.__name__, "export_history_async")
+        response = await self.async_client.get(reverse("export_history", args=("csv",)))
+        text = "".join([chunk.decode() async for chunk in response.streaming_content])
+        self.assertEqual(text.splitlines()[0], ",".join(HISTORY_COLUMNS))
+        self.assertIn('"Plank, weighted"', text)
+        self.assertEqual(len(text.splitlines()), 13)
+
+
+class AnalyticsTests(TestCase):
+    def test_compute(self):
+        start = date(2024, 1, 1).toordinal()
+        history = analytics.SetHistory(
+            days=np.array([0, 0, 7, 7, 14, 14]) + start,
+            reps=np.array([5, 3, 5, 20, 6, 5], dtype=float),
+            pounds=np.array([100, 120, 105, 50, 105, 100], dtype=float),
+        )
+        progress = analytics.compute(Exercise(name="Squat", category="MAIN"), history, trend_window=2)
+        np.testing.assert_array_equal(progress.sessions, [start, start + 7, start + 14])
+        np.testing.assert_allclose(progress.best_e1rm, [132, 122.5, 126])
+        np.testing.assert_array_equal(progress.tonnage, [860, 1525, 1130])
+        np.testing.assert_allclose(progress.trend, [np.nan, -9.5, 3.5])
+        # At 100 lbs the PR was matched later, but first set on day 0; 20 reps is too many for an e1RM
+        np.testing.assert_array_equal(
+            progress.rep_prs, [[50, 20, start + 7], [100, 5, start], [105, 6, start + 14], [120, 3, start]]
+        )
+        self.assertEqual(
+            progress.digest()[1], "Rep PRs at last weights: 100 lbs x 5 (2024-01-01); 105 lbs x 6 (2024-01-15)"
+        )
+
+    def test_timed_exercises_trend_on_seconds(self):
+        history = analytics.SetHistory(
+            days=np.arange(4) + date(2024, 1, 1).toordinal(), reps=np.array([30.0, 40, 50, 60]), pounds=np.zeros(4)
+        )
+        progress = analytics.compute(Exercise(name="Plank", category="CORE", is_seconds=True), history, 3)
+        self.assertEqual(progress.trend_metric, "reps_or_secs")
+        np.testing.assert_allclose(progress.trend, [np.nan, np.nan, 70, 70])
+        self.assertEqual(
+            progress.digest(),
+            [
+                "Long-term: 4 sessions since 2024-01-01; most secs 60, latest 60; trend +70.0 secs/week over the last 3 sessions"
+            ],
+        )
+
+    def test_endpoint(self):
+        exercise = Exercise.objects.create(name="Squat", category="MAIN")
+        make_history([exercise], 3)
+        response = self.client.get(reverse("exercise_progress", args=(exercise.pk,)), {"window": 2})
+        self.assertEqual(response.status_code, 200)
+        progress = response.json()
+        self.assertEqual(progress["trend_metric"], "e1rm")
+        self.assertEqual(
+            progress["sessions"],
+            {
+                "date": ["2024-01-01", "2024-01-02", "2024-01-03"],
+                "tonnage": [1015.0, 1218.0, 1421.0],
+                "best_e1rm": [119.0, 122.4, 125.8],
+                "best_reps_or_secs": [5.0, 6.0, 7.0],
+                "trend_per_week": [None, 23.8, 23.8],
+            },
+        )
+        self.assertEqual(
+            progress["rep_prs"],
+            [
+                {"pounds": 101, "reps_or_secs": 7, "date": "2024-01-03"},
+                {"pounds": 102, "reps_or_secs": 7, "date": "2024-01-03"},
+            ],
+        )
+        self.assertEqual(
+            self.client.get(reverse("exercise_progress", args=(exercise.pk,)), {"window": 1}).status_code, 400
+        )
+        empty = Exercise.objects.create(name="Lunge", category="MAIN")
+        self.assertEqual(self.client.get(reverse("exercise_progress", args=(empty.pk,))).status_code, 404)
+
+    def test_digests_are_cached_until_stats_refresh(self):
+        cache.clear()
+        exercise = Exercise.objects.create(name="Squat", category="MAIN")
+        make_history([exercise], 3)
+        exercise_stats.refresh([exercise.pk])
+
+        def digest():
+            return analytics.get_digests([exercise], exercise_stats.get_many([exercise.pk]))[exercise.pk][0]
+
+        self.assertIn("3 sessions", digest())
+        make_history([exercise], 2, start=date(2024, 2, 1))
+        with self.assertNumQueries(1):
+            self.assertIn("3 sessions", digest())
+        # The refresh needn't happen in this process, as it changes the key rather than the cache
+        exercise_stats.refresh([exercise.pk])
+        self.assertIn("5 sessions", digest())
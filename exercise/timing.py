@@ -0,0 +1,113 @@
+"""Per-request timings, reported by ServerTimingMiddleware
+
+The middleware puts a Timings in `current` for the duration of a request
+(and of its streamed body); the query wrapper, the template backend and the
+LLM stream helpers add to whichever Timings is current, and do nothing
+outside a request.
+"""
+
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+from django.template.backends.django import reraise
+
+current: ContextVar["Timings | None"] = ContextVar("request_timings", default=None)
+
+
+class Timings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = defaultdict(float)  # Name -> seconds
+        self.counts = defaultdict(int)
+
+    def add(self, name, seconds):
+        self.durations[name] += seconds
+        self.counts[name] += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        """Server-Timing header value for everything recorded so far"""
+        metrics = []
+        for name, seconds in self.durations.items():
+            metric = f"{name};dur={seconds * 1000:.1f}"
+            if name == "sql":
+                metric += f';desc="{self.counts[name]} queries"'
+            metrics.append(metric)
+        return ", ".join(metrics)
+
+    def as_dict(self):
+        timings = {f"{name}_ms": round(seconds * 1000, 1) for name, seconds in self.durations.items()}
+        if "sql" in self.counts:
+            timings["sql_count"] = self.counts["sql"]
+        return timings
+
+
+@contextmanager
+def measure(name):
+    """Add the time spent in the block to the current request's `name` timing"""
+    timings = current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper timing every query"""
+    with measure("sql"):
+        return execute(sql, params, many, context)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created receiver adding record_query to each new connection"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def first_token(chunks):
+    """Pass `chunks` through, recording how long the first one took as llm_ttft"""
+    timings = current.get()
+    start = time.perf_counter()
+    for chunk in chunks:
+        if timings is not None and "llm_ttft" not in timings.durations:
+            timings.add("llm_ttft", time.perf_counter() - start)
+        yield chunk
+
+
+async def afirst_token(chunks):
+    """Async counterpart of first_token"""
+    timings = current.get()
+    start = time.perf_counter()
+    async for chunk in chunks:
+        if timings is not None and "llm_ttft" not in timings.durations:
+            timings.add("llm_ttft", time.perf_counter() - start)
+        yield chunk
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        with measure("template"):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The standard Django template backend, with rendering time recorded as the template timing"""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,82 @@
+from typing import AsyncIterator, Iterable
+
+from asgiref.sync import sync_to_async
+
+from exercise import background
+from exercise.coach import MODEL, aget_trainer_summary, get_trainer_summary, trainer_summary_hash
+from exercise.history import load_category_comparison
+from exercise.models import Exercise, TrainerSummary, Workout
+
+
+def get_executor():
+    return background.get_executor("trainer-summary", len(Exercise.CATEGORIES))
+
+
+def lookup(workout, category, exercise_data) -> str | None:
+    """Return the stored summary if it was generated from exactly this data with the current model"""
+    return (
+        TrainerSummary.objects.filter(
+            workout=workout, category=category, prompt_hash=trainer_summary_hash(exercise_data), model=MODEL
+        )
+        .values_list("text", flat=True)
+        .first()
+    )
+
+
+def store(workout, category, exercise_data, text):
+    TrainerSummary.objects.update_or_create(
+        workout=workout,
+        category=category,
+        defaults={"prompt_hash": trainer_summary_hash(exercise_data), "model": MODEL, "text": text},
+    )
+
+
+def stream(workout, category, exercise_data) -> Iterable[str]:
+    """Stream the trainer summary, serving and saving it for completed workouts"""
+    if not workout.completed:
+        yield from get_trainer_summary(exercise_data)
+        return
+
+    if (stored := lookup(workout, category, exercise_data)) is not None:
+        yield stored
+        return
+
+    chunks = []
+    for text in get_trainer_summary(exercise_data):
+        chunks.append(text)
+        yield text
+    store(workout, category, exercise_data, "".join(chunks))
+
+
+async def astream(workout, category, exercise_data) -> AsyncIterator[str]:
+    """Async counterpart of stream"""
+    if workout.completed and (stored := await sync_to_async(lookup)(workout, category, exercise_data)) is not None:
+        yield stored
+        return
+
+    chunks = []
+    async for text in aget_trainer_summary(exercise_data):
+        chunks.append(text)
+        yield text
+    if workout.completed:
+        await sync_to_async(store)(workout, category, exercise_data, "".join(chunks))
+
+
+def generate(workout, category) -> TrainerSummary | None:
+    """Generate and store the summary for one category unless an up-to-date one exists"""
+    exercise_data = load_category_comparison(workout, category)
+    if not exercise_data:
+        return None
+    if lookup(workout, category, exercise_data) is None:
+        store(workout, category, exercise_data, "".join(get_trainer_summary(exercise_data)))
+    return TrainerSummary.objects.get(workout=workout, category=category)
+
+
+@background.closes_connections
+def generate_in_thread(workout_pk, category):
+    return generate(Workout.objects.get(pk=workout_pk), category)
+
+
+def generate_all_in_background(workout_pk):
+    """Generate the summaries for every category of a completed workout concurrently"""
+    return [get_executor().submit(generate_in_thread, workout_pk, category) for category, _ in Exercise.CATEGORIES]
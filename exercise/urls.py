@@ -6,12 +6,17 @@ from exercise.views import (
     next_category,
     workout_step,
     workout_set,
+    sync_sets,
+    superset_bundle,
+    exercise_progress,
     summarize_category,
     workout_summary,
     finish_workout,
     workouts_index,
     coach_stream,
+    speculation_stats,
     trainer_summary_stream,
+    export_history,
 )
 
 urlpatterns = [
@@ -23,12 +28,17 @@ urlpatterns = [
     path("summarize/<str:category>/<int:workout_id>/", summarize_category, name="summarize_category_past"),
     path("workout-step/<int:workout>/<int:step>/", workout_step, name="workout_step"),
     path("workout-set/<int:set_num>/wo/<int:exercise>/", workout_set, name="workout_set"),
+    path("sync-sets/", sync_sets, name="sync_sets"),
+    path("superset/<str:category>/", superset_bundle, name="superset_bundle"),
     path("workouts/", workouts_index, name="workouts_index"),
     path("workouts/<int:workout>/", workout_summary, name="workout_summary"),
     path("finish-workout/<int:workout>/", finish_workout, name="finish_workout"),
+    path("progress/<int:exercise>/", exercise_progress, name="exercise_progress"),
     path("coach-stream/<int:exercise>/", coach_stream, name="coach_stream"),
+    path("coach-speculation/", speculation_stats, name="speculation_stats"),
     path("trainer-summary/<str:category>/", trainer_summary_stream, name="trainer_summary_stream"),
     path(
         "trainer-summary/<str:category>/<int:workout_id>/", trainer_summary_stream, name="trainer_summary_stream_past"
     ),
+    path("export/history.<str:fmt>", export_history, name="export_history"),
 ]
@@ -1,29 +1,23 @@
+import hashlib
 import json
 import pytz
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
-from django.urls import reverse
+from django.conf import settings
+from django.contrib import messages
+from django.urls import Resolver404, resolve, reverse
+from django.core.cache import cache
 from django.utils import timezone
 from django.db import transaction
-from django.db.models import Max, Case, When, DateField, F, Prefetch
-from django.http import StreamingHttpResponse
-from exercise.models import Exercise, Workout, Set, WorkoutExercise
-
-
-def fetch_set_and_date(exercise):
-    latest_workout_exercise = (
-        exercise.workoutexercise_set.filter(workout__completed=True)
-        .order_by("-workout__date")
-        .select_related("workout")
-        .first()
-    )
-    if not latest_workout_exercise:
-        return [], None
-
-    set_str = ""
-    if set_instance := latest_workout_exercise.sets.order_by("-set_num").first():
-        set_str = set_instance.render()
-
-    return set_str, latest_workout_exercise.workout.date
+from django.db.models import Max, Case, When, DateField, F, OuterRef, Prefetch, Subquery, Value
+from django.db.models import prefetch_related_objects
+from django.db.models.functions import Coalesce
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from exercise import analytics, export, speculation, timing, trainer_summaries
+from exercise import stats as exercise_stats
+from exercise.models import Exercise, Workout, Set, SyncedSetKey, WorkoutExercise
+from exercise.history import load_category_comparison, ordered_sets, recent_history
 
 
 def index(_):
@@ -51,12 +45,14 @@ def index(_):
 
 
 def choose_next_category(request, category: str):
-    exercise_qset = Exercise.objects.filter(category=category)
+    category_exercises = list(Exercise.objects.filter(category=category))
+    stats = exercise_stats.get_many([exercise.pk for exercise in category_exercises])
 
     exercises = []
-    for exercise in exercise_qset:
-        set_str, latest_date = fetch_set_and_date(exercise)
-        exercises.append({"exercise": exercise, "set": set_str, "latest_date": latest_date})
+    for exercise in category_exercises:
+        exercise_stat = stats[exercise.pk]
+        set_str = exercise_stat.last_sets[-1] if exercise_stat.last_sets else ""
+        exercises.append({"exercise": exercise, "set": set_str, "latest_date": exercise_stat.last_date})
 
     # Sort exercises by latest_date
     exercises.sort(key=lambda x: (x["latest_date"] is None, x["latest_date"]))
@@ -140,17 +136,18 @@ def next_category(request, category):
     )
 
 
-def gen_workout_steps(workout):
-    exercises = list(Workout.objects.get(pk=workout).exercises.order_by("order"))
+def gen_workout_steps(workout, exercises):
+    """Yield the workout's steps as (view name, args), given its (WorkoutExercise pk, category) pairs in order"""
     for category, set_count in SUPERSETS.items():
         yield ("choose_next_category", (category,))
         yield ("preview_category", (category,))
         for set_num in range(0, set_count):
-            for exercise in filter(lambda wo: wo.exercise.category == category, exercises):
-                yield (
-                    "workout_set",
-                    (set_num + 1, exercise.pk),
-                )
+            for exercise, exercise_category in exercises:
+                if exercise_category == category:
+                    yield (
+                        "workout_set",
+                        (set_num + 1, exercise),
+                    )
         yield ("summarize_category", (category,))
     yield (
         "finish_workout",
@@ -158,42 +155,77 @@ def gen_workout_steps(workout):
     )
 
 
-def workout_step(_, workout, step):
-    view_name, args = list(gen_workout_steps(workout))[step]
-    return redirect(view_name, *args, permanent=False)
+STEP_PLAN_TIMEOUT = 60 * 60 * 12  # Seconds
 
 
-def get_step_urls(request_path, workout_pk):
-    step = None
-    count = 0
-    for view_name, args in gen_workout_steps(workout_pk):
-        path = reverse(view_name, args=args)
-        if path == request_path:
-            step = count
-        count += 1
+def step_plan_key(workout_pk, exercises):
+    """Cache key for a plan of the workout with these (WorkoutExercise pk, category) pairs
+
+    The pairs are part of the key because each process has its own cache:
+    once a block is saved, every process looks up a different key instead of
+    serving a plan it was never told is stale.
+    """
+    fingerprint = hashlib.sha256(json.dumps(exercises).encode()).hexdigest()
+    return f"workout_step_plan:{workout_pk}:{fingerprint}"
+
+
+def get_step_plan(workout_pk):
+    """Return the workout's step URLs in order, plus a map from path to step index
+
+    Costs one query, for the exercises the plan is built from.
+    """
+    exercises = list(
+        WorkoutExercise.objects.filter(workout=workout_pk)
+        .order_by("order", "pk")
+        .values_list("pk", "exercise__category")
+    )
+    key = step_plan_key(workout_pk, exercises)
+    plan = cache.get(key)
+    if plan is None:
+        urls = [reverse(view_name, args=args) for view_name, args in gen_workout_steps(workout_pk, exercises)]
+        plan = {
+            "urls": urls,
+            "steps": {url: step for step, url in enumerate(urls)},
+        }
+        cache.set(key, plan, STEP_PLAN_TIMEOUT)
+    return plan
+
+
+def workout_step(_, workout, step):
+    return redirect(get_step_plan(workout)["urls"][step], permanent=False)
 
+
+def get_step_urls(request_path, workout_pk, plan=None):
+    plan = plan or get_step_plan(workout_pk)
+    step = plan["steps"].get(request_path)
     if step is None:
         raise ValueError(f"Step not found for {request_path}")
 
     def get_url(dir):
         new_step = step + dir
-        if new_step >= 0 and new_step < count:
-            return reverse("workout_step", args=(workout_pk, step + dir))
+        if new_step >= 0 and new_step < len(plan["urls"]):
+            return reverse("workout_step", args=(workout_pk, new_step))
 
         return None
 
     return {"prev_url": get_url(-1), "next_url": get_url(1)}
 
 
-def get_set(exercise, set_num):
+def get_set_page_exercise(url):
+    """Return the WorkoutExercise pk shown at url if it leads to a set page"""
+    if not url:
+        return None
     try:
-        return Set.objects.get(exercise=exercise, set_num=set_num)
-    except Set.DoesNotExist:
+        match = resolve(url)
+        if match.url_name == "workout_step":
+            match = resolve(get_step_plan(match.kwargs["workout"])["urls"][match.kwargs["step"]])
+    except (Resolver404, IndexError, TypeError):
         return None
+    return match.kwargs["exercise"] if match.url_name == "workout_set" else None
 
 
 def workout_set(request, set_num, exercise):
-    wo = WorkoutExercise.objects.get(pk=exercise)
+    wo = WorkoutExercise.objects.select_related("exercise", "workout").get(pk=exercise)
     if request.method == "POST":
         reps_or_secs = request.POST["reps_or_secs"]
         pounds = request.POST["pounds"]
@@ -214,23 +246,25 @@ def workout_set(request, set_num, exercise):
             duration_secs=duration_secs,
         )
         new_set.save()
+        for record in exercise_stats.record_set(new_set):
+            messages.success(request, record)
+        if settings.COACH_SPECULATION and (next_exercise := get_set_page_exercise(next_url)):
+            speculation.speculate(next_exercise)
         return redirect(next_url)
 
-    today_sets = Set.objects.filter(exercise=wo).order_by("set_num")
+    today_sets = list(wo.sets.order_by("set_num"))
     last_workout = None
-    try:
-        last_workout = Workout.objects.filter(completed=True, exercises__exercise=wo.exercise).latest("date")
-        last_exercise = WorkoutExercise.objects.get(workout=last_workout, exercise=wo.exercise)
-        last_sets = Set.objects.filter(exercise=last_exercise)
-    except Workout.DoesNotExist:
-        last_sets = []
+    last_sets = []
+    if last_exercise := exercise_stats.get(wo.exercise_id).last_workout_exercise:
+        last_workout = last_exercise.workout
+        last_sets = last_exercise.sets.order_by("set_num")
 
     return render(
         request,
         "set.html",
         {
             "exercise": wo,
-            "current_set": get_set(wo.pk, set_num),
+            "current_set": next((s for s in today_sets if s.set_num == set_num), None),
             "set_num": set_num,
             "today_sets": today_sets,
             "last_sets": last_sets,
@@ -240,6 +274,176 @@ def workout_set(request, set_num, exercise):
     )
 
 
+SYNCED_SET_FIELDS = ["reps_or_secs", "pounds", "duration_secs", "note"]
+MAX_SYNC_BATCH = 200  # Sets accepted per sync request
+
+
+def optional_count(value):
+    if value is None or value == "":
+        return None
+    if (count := int(value)) < 0:
+        raise ValueError(f"{value!r} is negative")
+    return count
+
+
+def parse_synced_set(item):
+    """(idempotency key, unsaved Set) for one entry of a sync batch"""
+    key = str(item["key"])
+    if not 0 < len(key) <= SyncedSetKey._meta.get_field("key").max_length:
+        raise ValueError(f"bad idempotency key {key!r}")
+    set_num = optional_count(item["set_num"])
+    if not set_num:
+        raise ValueError("set_num must be a positive number")
+    return key, Set(
+        exercise_id=int(item["exercise"]),
+        set_num=set_num,
+        reps_or_secs=optional_count(item.get("reps_or_secs")),
+        pounds=optional_count(item.get("pounds")),
+        duration_secs=optional_count(item.get("duration_secs")),
+        note=str(item.get("note") or ""),
+    )
+
+
+@require_POST
+def sync_sets(request):
+    """Save a batch of sets a client queued while offline, in one transaction
+
+    The body is JSON: {"sets": [{"key", "exercise", "set_num", "reps_or_secs",
+    "pounds", "duration_secs", "note"}, ...]}, where exercise is a
+    WorkoutExercise pk and key is an idempotency key the client picks for
+    each write. Entries whose key has been synced before are skipped, even if
+    the set was changed since, and the rest are upserted on (exercise,
+    set_num) with ON CONFLICT, so resending a batch after a lost response is
+    harmless. Later entries for the same set win.
+    """
+    try:
+        batch = [parse_synced_set(item) for item in json.loads(request.body)["sets"]]
+    except KeyError as e:
+        return JsonResponse({"error": f"Missing {e.args[0]}"}, status=400)
+    except (TypeError, ValueError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if len(batch) > MAX_SYNC_BATCH:
+        return JsonResponse({"error": f"At most {MAX_SYNC_BATCH} sets per batch"}, status=400)
+
+    workout_exercises = WorkoutExercise.objects.select_related("exercise", "workout").in_bulk(
+        {s.exercise_id for _, s in batch}
+    )
+    if unknown := sorted({s.exercise_id for _, s in batch} - workout_exercises.keys()):
+        return JsonResponse({"error": f"Unknown workout exercises {unknown}"}, status=400)
+
+    with transaction.atomic():
+        seen = set(SyncedSetKey.objects.filter(key__in=[key for key, _ in batch]).values_list("key", flat=True))
+        fresh = [(key, new_set) for key, new_set in batch if key not in seen]
+        pending = {}
+        for _, new_set in fresh:
+            new_set.exercise = workout_exercises[new_set.exercise_id]
+            pending[new_set.exercise_id, new_set.set_num] = new_set
+        records = []
+        if pending:
+            Set.objects.bulk_create(
+                pending.values(),
+                update_conflicts=True,
+                unique_fields=["exercise", "set_num"],
+                update_fields=SYNCED_SET_FIELDS,
+            )
+            SyncedSetKey.objects.bulk_create((SyncedSetKey(key=key) for key, _ in fresh), ignore_conflicts=True)
+            records = exercise_stats.record_sets(list(pending.values()))
+
+    return JsonResponse(
+        {
+            "saved": [key for key, _ in fresh],
+            "duplicates": [key for key, _ in batch if key in seen],
+            "records": records,
+        }
+    )
+
+
+def set_data(set_instance):
+    return {
+        "set_num": set_instance.set_num,
+        "reps_or_secs": set_instance.reps_or_secs,
+        "pounds": set_instance.pounds,
+        "duration_secs": set_instance.duration_secs,
+        "note": set_instance.note,
+        "text": set_instance.render(),
+    }
+
+
+def superset_bundle(request, category):
+    """Everything a client needs to run the active workout's `category` block without more requests
+
+    Returns the block's exercises in order with today's and last workout's
+    sets, and its set pages in the order the workout visits them, each with
+    its workout_step URL. prev_url and next_url lead out of the block, and
+    sets logged on the client go to sync_url. Costs a fixed number of queries
+    however long the history is.
+    """
+    if category not in SUPERSETS:
+        raise Http404(f"Unknown category {category}")
+    workout = Workout.objects.filter(completed=False).first()
+    exercises = (
+        list(
+            workout.exercises.filter(exercise__category=category)
+            .select_related("exercise")
+            .prefetch_related(ordered_sets())
+            .order_by("order")
+        )
+        if workout
+        else []
+    )
+    if not exercises:
+        raise Http404(f"The active workout has no {category} exercises")
+
+    stats = exercise_stats.get_many([wo.exercise_id for wo in exercises])
+    last_exercises = [row.last_workout_exercise for row in stats.values() if row.last_workout_exercise]
+    prefetch_related_objects(last_exercises, ordered_sets())
+    last_by_exercise = {wo.exercise_id: wo for wo in last_exercises}
+
+    set_pages = [
+        (set_num, wo.pk, reverse("workout_set", args=(set_num, wo.pk)))
+        for set_num in range(1, SUPERSETS[category] + 1)
+        for wo in exercises
+    ]
+    plan = get_step_plan(workout.pk)
+    steps = [
+        {"set_num": set_num, "exercise": pk, "url": reverse("workout_step", args=(workout.pk, plan["steps"][path]))}
+        for set_num, pk, path in set_pages
+    ]
+
+    exercise_data = []
+    for wo in exercises:
+        last = last_by_exercise.get(wo.exercise_id)
+        exercise_data.append(
+            {
+                "id": wo.pk,
+                "exercise": wo.exercise_id,
+                "name": wo.name,
+                "order": wo.order,
+                "is_seconds": wo.is_seconds,
+                "is_sides": wo.is_sides,
+                "today_sets": [set_data(s) for s in wo.sets.all()],
+                "last_workout": last.workout.date.isoformat() if last else None,
+                "last_sets": [set_data(s) for s in last.sets.all()] if last else [],
+            }
+        )
+
+    first_set = reverse("workout_set", args=(1, exercises[0].pk))
+    last_set = reverse("workout_set", args=(SUPERSETS[category], exercises[-1].pk))
+    return JsonResponse(
+        {
+            "workout": workout.pk,
+            "category": category,
+            "name": Exercise.get_category_name(category),
+            "set_count": SUPERSETS[category],
+            "exercises": exercise_data,
+            "steps": steps,
+            "prev_url": get_step_urls(first_set, workout.pk, plan)["prev_url"],
+            "next_url": get_step_urls(last_set, workout.pk, plan)["next_url"],
+            "sync_url": reverse("sync_sets"),
+        }
+    )
+
+
 def summarize_category(request, category, workout_id=None):
     """
     Summarize exercises in a category.
@@ -260,53 +464,14 @@ def summarize_category(request, category, workout_id=None):
             # No active workout, create one
             workout = Workout.objects.create(completed=False)
 
-    # Get exercises for this category in the workout
-    exercises = workout.exercises.filter(exercise__category=category).order_by("order")
+    # Get exercises for this category in the workout, paired with their previous performance
+    exercise_data = load_category_comparison(workout, category)
 
     # If no exercises found for this category in this workout
-    if not exercises.exists() and not workout_id:
+    if not exercise_data and not workout_id:
         # This is for active workouts only - redirect to choose exercises
         return redirect("choose_next_category", category)
 
-    exercise_data = []
-    for exercise in exercises:
-        current_sets = list(map(lambda s: s.render(), exercise.sets.all().order_by("set_num")))
-
-        # For previous workout comparison
-        # For a past workout view, we want to compare with the workout before that one
-        # For active workout, we want to compare with the last completed workout
-        if workout.completed:
-            # Find the previous workout with this exercise before the current one
-            last_workout = (
-                Workout.objects.filter(completed=True, exercises__exercise=exercise.exercise, date__lt=workout.date)
-                .order_by("-date")
-                .first()
-            )
-        else:
-            # Find the last completed workout with this exercise
-            last_workout = (
-                Workout.objects.filter(completed=True, exercises__exercise=exercise.exercise).order_by("-date").first()
-            )
-
-        last_sets = []
-        if last_workout:
-            try:
-                last_exercise = WorkoutExercise.objects.get(workout=last_workout, exercise=exercise.exercise)
-                last_sets = list(
-                    map(lambda s: s.render(), Set.objects.filter(exercise=last_exercise).order_by("set_num"))
-                )
-            except WorkoutExercise.DoesNotExist:
-                pass
-
-        exercise_data.append(
-            {
-                "exercise": exercise,
-                "current_sets": current_sets,
-                "last_sets": last_sets,
-                "last_workout": last_workout,
-            }
-        )
-
     category_name = dict(Exercise.CATEGORIES)[category]
 
     # Navigation buttons are only relevant for the active workout
@@ -344,50 +509,62 @@ def summarize_category(request, category, workout_id=None):
     )
 
 
+def with_neighbor_workouts(queryset):
+    """Annotate workouts with the pks of the previous and next workout by date
+
+    The undated (active) workout comes after every dated one.
+    """
+    dated = Workout.objects.exclude(date=None)
+    prev_dated = dated.filter(date__lt=OuterRef("date")).order_by("-date").values("pk")[:1]
+    next_dated = dated.filter(date__gt=OuterRef("date")).order_by("date").values("pk")[:1]
+    latest_dated = dated.order_by("-date").values("pk")[:1]
+    undated = Workout.objects.filter(date=None).exclude(pk=OuterRef("pk")).values("pk")[:1]
+    return queryset.annotate(
+        prev_workout_id=Case(
+            When(date__isnull=True, then=Subquery(latest_dated)),
+            default=Subquery(prev_dated),
+        ),
+        next_workout_id=Case(
+            When(date__isnull=True, then=Value(None)),
+            default=Coalesce(Subquery(next_dated), Subquery(undated)),
+        ),
+    )
+
+
 def workout_summary(request, workout):
-    workout = Workout.objects.prefetch_related(
-        Prefetch(
-            "exercises",
-            queryset=WorkoutExercise.objects.select_related("exercise")
-            .prefetch_related(Prefetch("sets", queryset=Set.objects.order_by("set_num")))
-            .order_by("order"),
+    workout = with_neighbor_workouts(
+        Workout.objects.prefetch_related(
+            Prefetch(
+                "exercises",
+                queryset=WorkoutExercise.objects.select_related("exercise")
+                .prefetch_related(Prefetch("sets", queryset=Set.objects.order_by("set_num")))
+                .order_by("order"),
+            )
         )
     ).get(pk=workout)
 
-    if workout.date is not None:
-        # Fetch the next and previous workouts by date
-        next_workout = Workout.objects.filter(date__gt=workout.date).order_by("date").first()
-        if not next_workout:
-            next_workout = Workout.objects.filter(date__isnull=True).first()
-
-        prev_workout = Workout.objects.filter(date__lt=workout.date).order_by("-date").first()
-    else:
-        # If workout.date is empty, there's no next workout
-        next_workout = None
-        # Fetch the previous workout by date
-        prev_workout = Workout.objects.exclude(date=None).order_by("-date").first()
+    # Group the prefetched exercises by category rather than querying per category
+    by_category = {category: [] for category, _ in Exercise.CATEGORIES}
+    for exercise in workout.exercises.all():
+        by_category[exercise.category].append(
+            {
+                "name": exercise.name,
+                "sets": [s.render() for s in exercise.sets.all()],
+            }
+        )
 
     supersets = []
     for category, category_name in Exercise.CATEGORIES:
-        exercises = workout.exercises.filter(exercise__category=category)
-        exercise_data = []
-        for exercise in exercises:
-            exercise_data.append(
-                {
-                    "name": exercise.name,
-                    "sets": map(lambda s: s.render(), exercise.sets.all()),
-                }
-            )
         superset = {
             "name": category_name,
-            "exercises": exercise_data,
+            "exercises": by_category[category],
         }
         supersets.append(superset)
     context = {
         "workout": workout,
         "supersets": supersets,
-        "next_workout": next_workout,
-        "prev_workout": prev_workout,
+        "next_workout_id": workout.next_workout_id,
+        "prev_workout_id": workout.prev_workout_id,
     }
 
     return render(request, "workout_summary.html", context)
@@ -406,6 +583,12 @@ def finish_workout(request, workout):
     workout.completed = True
     workout.save()
 
+    # This is now the last workout for each of its exercises
+    exercise_stats.refresh(list(workout.exercises.values_list("exercise_id", flat=True).distinct()))
+
+    # The workout's data is now final; have the trainer summaries ready for later visits
+    trainer_summaries.generate_all_in_background(workout.pk)
+
     return redirect(reverse("workout_summary", args=(workout.pk,)))
 
 
@@ -414,19 +597,28 @@ def workouts_index(request):
     return redirect(reverse("workout_summary", args=(workout.pk,)))
 
 
-def get_exercise_summary(exercise_id):
+SUMMARY_HISTORY_DEPTH = 2  # Previous workouts shown per exercise in the coach summary
+
+
+def get_exercise_summary(exercise_id, history_depth=SUMMARY_HISTORY_DEPTH):
     """Generate a workout summary showing exercise history and current progress"""
     # Get the current exercise and its category
     wo = WorkoutExercise.objects.select_related("exercise", "workout").get(pk=exercise_id)
     category = wo.exercise.category
 
     # Get all exercises in this category for today's workout
-    category_exercises = (
+    category_exercises = list(
         WorkoutExercise.objects.filter(workout=wo.workout, exercise__category=category)
         .select_related("exercise")
+        .prefetch_related(Prefetch("sets", queryset=Set.objects.order_by("set_num")))
         .order_by("order")
     )
 
+    # Get previous workouts for every exercise in one go, and the long view of each
+    history = recent_history([exercise.exercise_id for exercise in category_exercises], history_depth)
+    stats = exercise_stats.get_many([exercise.exercise_id for exercise in category_exercises])
+    digests = analytics.get_digests([exercise.exercise for exercise in category_exercises], stats)
+
     narrative = []
     narrative.append(f"== {Exercise.get_category_name(category)} ==")
     narrative.append(f"Currently on: {wo.exercise.name}")
@@ -436,31 +628,18 @@ def get_exercise_summary(exercise_id):
     for exercise in category_exercises:
         narrative.append(f"* {exercise.exercise.name} *")
 
-        # Get previous workouts for this exercise
-        previous_sets = Set.objects.filter(
-            exercise__exercise=exercise.exercise, exercise__workout__completed=True
-        ).order_by("-exercise__workout__date")
-
-        # Group by workout date
-        prev_dates = {}
-        for set in previous_sets:
-            date = set.exercise.workout.date
-            if date not in prev_dates:
-                prev_dates[date] = []
-            prev_dates[date].append(set)
-        prev_dates = dict(sorted(list(prev_dates.items())[:2], reverse=True))  # Last 2 dates
-
         # Show previous attempts
-        if prev_dates:
-            for date, sets in prev_dates.items():
+        if prev_dates := history.get(exercise.exercise_id):
+            for date, sets in prev_dates:
                 days_ago = (timezone.now().date() - date).days
-                sets_str = "; ".join(f"Set {s.set_num}: {s.render()}" for s in sorted(sets, key=lambda x: x.set_num))
+                sets_str = "; ".join(f"Set {s.set_num}: {s.render()}" for s in sets)
                 narrative.append(f"{days_ago} days ago: {sets_str}")
         else:
             narrative.append("No previous attempts")
+        narrative.extend(digests[exercise.exercise_id])
 
         # Show today's progress
-        today_sets = Set.objects.filter(exercise=exercise).order_by("set_num")
+        today_sets = exercise.sets.all()
         narrative.append(
             "Today: "
             + ("; ".join(f"Set {s.set_num}: {s.render()}" for s in today_sets) if today_sets else "Not started yet")
@@ -470,100 +649,142 @@ def get_exercise_summary(exercise_id):
     return narrative
 
 
+def exercise_progress(request, exercise):
+    """Long-term progress of an exercise over its full history as JSON, from analytics.Progress.as_dict
+
+    ?window sets how many sessions each trend slope is fitted over.
+    """
+    try:
+        window = int(request.GET.get("window", analytics.TREND_WINDOW))
+    except ValueError:
+        window = 0
+    if window < 2:
+        return JsonResponse({"error": "window must be a number of sessions, at least 2"}, status=400)
+    try:
+        exercise = Exercise.objects.get(pk=exercise)
+    except Exercise.DoesNotExist:
+        raise Http404(f"No exercise {exercise}")
+    if (progress := analytics.load_progress([exercise], window).get(exercise.pk)) is None:
+        raise Http404(f"No completed sets of {exercise}")
+    return JsonResponse(progress.as_dict())
+
+
+def sse_event(text):
+    # Replace actual newlines with a special token our JavaScript can interpret
+    formatted_text = text.replace("\n", "||NEWLINE||")
+    return f"data: {formatted_text}\n\n"
+
+
+def sse_response(streaming_content):
+    response = StreamingHttpResponse(streaming_content=streaming_content, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 def generate_coach_stream(exercise_id):
     """Generate SSE events for coach response"""
     from .coach import get_coach_response
 
     summary_lines = get_exercise_summary(exercise_id)
-    for text in get_coach_response(summary_lines):
-        # Replace actual newlines with a special token our JavaScript can interpret
-        formatted_text = text.replace("\n", "||NEWLINE||")
-        yield f"data: {formatted_text}\n\n"
+    if settings.COACH_SPECULATION:
+        speculation.claim(exercise_id, summary_lines)
+    for text in timing.first_token(get_coach_response(summary_lines)):
+        yield sse_event(text)
+
+
+async def agenerate_coach_stream(exercise_id):
+    """Async counterpart of generate_coach_stream for ASGI deployments"""
+    from .coach import aget_coach_response
+
+    summary_lines = await sync_to_async(get_exercise_summary)(exercise_id)
+    if settings.COACH_SPECULATION:
+        speculation.claim(exercise_id, summary_lines)
+    async for text in timing.afirst_token(aget_coach_response(summary_lines)):
+        yield sse_event(text)
 
 
 def coach_stream(request, exercise):
-    response = StreamingHttpResponse(
-        streaming_content=generate_coach_stream(exercise), content_type="text/event-stream"
-    )
-    response["Cache-Control"] = "no-cache"
-    response["X-Accel-Buffering"] = "no"
-    return response
+    return sse_response(generate_coach_stream(exercise))
 
 
-def generate_trainer_summary_stream(category, workout_id=None):
-    """Generate SSE events for trainer category summary"""
-    from .coach import get_trainer_summary
+async def coach_stream_async(request, exercise):
+    return sse_response(agenerate_coach_stream(exercise))
+
 
+def speculation_stats(request):
+    return JsonResponse({"enabled": settings.COACH_SPECULATION, **speculation.get_stats()})
+
+
+def load_trainer_summary_data(category, workout_id=None):
+    """Return (error message, workout, exercise data) for the trainer summary of a category"""
     # Get workout data - same logic as summarize_category view
     if workout_id:
         try:
             workout = Workout.objects.get(pk=workout_id)
         except Workout.DoesNotExist:
-            yield f"data: No workout found with ID {workout_id}\n\n"
-            return
+            return f"No workout found with ID {workout_id}", None, None
     else:
         try:
             workout = Workout.objects.get(completed=False)
         except Workout.DoesNotExist:
-            yield f"data: No active workout found\n\n"
-            return
+            return "No active workout found", None, None
+
+    # Get exercises for this category, formatted with previous workout data for the trainer
+    exercise_data = load_category_comparison(workout, category)
+    if not exercise_data:
+        return f"No exercises found for category {category}", None, None
+    return None, workout, exercise_data
 
-    # Get exercises for this category
-    exercises = workout.exercises.filter(exercise__category=category).order_by("order")
-    if not exercises.exists():
-        yield f"data: No exercises found for category {category}\n\n"
+
+def generate_trainer_summary_stream(category, workout_id=None):
+    """Generate SSE events for trainer category summary"""
+    error, workout, exercise_data = load_trainer_summary_data(category, workout_id)
+    if error:
+        yield f"data: {error}\n\n"
         return
 
-    # Format exercise data for the trainer
-    exercise_data = []
-    for exercise in exercises:
-        current_sets = list(map(lambda s: s.render(), exercise.sets.all().order_by("set_num")))
-
-        # Get previous workout data for comparison
-        if workout.completed:
-            last_workout = (
-                Workout.objects.filter(completed=True, exercises__exercise=exercise.exercise, date__lt=workout.date)
-                .order_by("-date")
-                .first()
-            )
-        else:
-            last_workout = (
-                Workout.objects.filter(completed=True, exercises__exercise=exercise.exercise).order_by("-date").first()
-            )
+    # Stream the trainer's analysis; completed workouts are served from the stored summary
+    for text in timing.first_token(trainer_summaries.stream(workout, category, exercise_data)):
+        yield sse_event(text)
 
-        last_sets = []
-        last_exercise = None
-        if last_workout:
-            try:
-                last_exercise = WorkoutExercise.objects.get(workout=last_workout, exercise=exercise.exercise)
-                last_sets = list(
-                    map(lambda s: s.render(), Set.objects.filter(exercise=last_exercise).order_by("set_num"))
-                )
-            except WorkoutExercise.DoesNotExist:
-                pass
 
-        exercise_data.append(
-            {
-                "exercise": exercise,
-                "current_sets": current_sets,
-                "last_sets": last_sets,
-                "last_workout": last_workout,
-                "last_exercise": last_exercise,  # Add the last_exercise object to provide access to its sets
-            }
-        )
+async def agenerate_trainer_summary_stream(category, workout_id=None):
+    """Async counterpart of generate_trainer_summary_stream for ASGI deployments"""
+    error, workout, exercise_data = await sync_to_async(load_trainer_summary_data)(category, workout_id)
+    if error:
+        yield f"data: {error}\n\n"
+        return
 
-    # Stream the trainer's analysis
-    for text in get_trainer_summary(exercise_data):
-        # Replace actual newlines with a special token our JavaScript can interpret
-        formatted_text = text.replace("\n", "||NEWLINE||")
-        yield f"data: {formatted_text}\n\n"
+    async for text in timing.afirst_token(trainer_summaries.astream(workout, category, exercise_data)):
+        yield sse_event(text)
 
 
 def trainer_summary_stream(request, category, workout_id=None):
     """Endpoint for streaming trainer summary for a workout category"""
-    response = StreamingHttpResponse(
-        streaming_content=generate_trainer_summary_stream(category, workout_id), content_type="text/event-stream"
-    )
-    response["Cache-Control"] = "no-cache"
-    response["X-Accel-Buffering"] = "no"
+    return sse_response(generate_trainer_summary_stream(category, workout_id))
+
+
+async def trainer_summary_stream_async(request, category, workout_id=None):
+    """Endpoint for streaming trainer summary for a workout category on the event loop"""
+    return sse_response(agenerate_trainer_summary_stream(category, workout_id))
+
+
+def export_response(fmt, streaming_content):
+    response = StreamingHttpResponse(streaming_content=streaming_content, content_type=export.FORMATS[fmt])
+    response["Content-Disposition"] = f'attachment; filename="history.{fmt}"'
     return response
+
+
+def export_history(request, fmt):
+    """Download every completed workout's sets as CSV or JSONL, oldest first"""
+    if fmt not in export.FORMATS:
+        raise Http404(f"Unknown export format {fmt}")
+    return export_response(fmt, export.stream(fmt))
+
+
+async def export_history_async(request, fmt):
+    """export_history on the event loop, so the export isn't buffered into a worker thread"""
+    if fmt not in export.FORMATS:
+        raise Http404(f"Unknown export format {fmt}")
+    return export_response(fmt, export.astream(fmt))
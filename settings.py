@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "exercise.middleware.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -51,11 +52,13 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
-ROOT_URLCONF = "urls"
+# asgi.py swaps in asgi_urls, which serves the SSE endpoints with async views
+ROOT_URLCONF = os.getenv("DJANGO_ROOT_URLCONF", "urls")
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # Django's backend, timing renders for the Server-Timing header
+        "BACKEND": "exercise.timing.DjangoTemplates",
         "DIRS": [os.path.join(BASE_DIR, "exercise/templates")],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -70,6 +73,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "wsgi.application"
+ASGI_APPLICATION = "asgi.application"
 
 
 # Database
@@ -132,3 +136,36 @@ STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Coach
+
+# Start generating the next set page's coach response as soon as a set is saved
+COACH_SPECULATION = os.getenv("COACH_SPECULATION", "") == "1"
+
+# Dotted path of the class that talks to the LLM; exercise.llm.StubBackend needs no network
+COACH_LLM_BACKEND = os.getenv("COACH_LLM_BACKEND", "exercise.llm.AnthropicBackend")
+COACH_STUB_DELAY = float(os.getenv("COACH_STUB_DELAY", "0"))
+
+# Connection pool and timeouts (seconds) for the shared Anthropic client
+ANTHROPIC_MAX_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "20"))
+ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS", "10"))
+ANTHROPIC_TIMEOUT = float(os.getenv("ANTHROPIC_TIMEOUT", "60"))
+ANTHROPIC_CONNECT_TIMEOUT = float(os.getenv("ANTHROPIC_CONNECT_TIMEOUT", "5"))
+ANTHROPIC_MAX_RETRIES = int(os.getenv("ANTHROPIC_MAX_RETRIES", "2"))
+
+# Upstream LLM streams allowed at once per ASGI process; further SSE clients wait their turn
+COACH_MAX_CONCURRENT_STREAMS = int(os.getenv("COACH_MAX_CONCURRENT_STREAMS", str(ANTHROPIC_MAX_CONNECTIONS)))
+
+
+# Request timing
+
+# Log a JSON line per request with its Server-Timing measurements (and, for streams, LLM time to first token)
+SERVER_TIMING_LOG = os.getenv("SERVER_TIMING_LOG", "") == "1"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {"exercise.timing": {"handlers": ["console"], "level": "INFO", "propagate": False}},
+}